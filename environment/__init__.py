@@ -1,2 +1,3 @@
 from .maze import Maze
 from .maze import Status
+from .vectormaze import VectorMaze
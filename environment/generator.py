@@ -0,0 +1,251 @@
+""" Maze generators.
+
+    All generators carve a perfect maze (exactly one path between any two cells) on the cells with even (col, row)
+    coordinates, the lattice, and open the walls in between. The start cell (0, 0) is always part of the lattice and
+    so is the exit, unless an explicit exit cell is requested; then a short passage from the exit to the nearest
+    lattice cell is opened. Either way the exit is guaranteed to be reachable, no need to retry until it is. A random
+    exit is never the start cell, so without an explicit exit the lattice needs at least 2 cells (a maze of at least
+    3 x 1 or 1 x 3 cells).
+
+    Available algorithms:
+
+        prim            randomized Prim's algorithm (simplified): grow the maze from a random cell on the frontier
+        backtracker     recursive backtracker (depth-first search): long winding corridors, few dead ends
+        binary_tree     every cell opens to the north or to the west: fast, but with a diagonal bias
+
+    Prim's and the backtracker carve cell by cell, also in generate_batch(), so their time grows with the number of
+    lattice cells; 10000 mazes of 101 x 101 take about 12 to 17 s. The binary tree is carved in a few numpy
+    operations and takes under 1 s for the same batch, so it is the better choice for bulk generation if its bias
+    is acceptable.
+
+    Mazes are 2D int8 arrays with empty cells (= 0) and walls (= 1), exits are (col, row) tuples. The same seed
+    always results in the same maze(s).
+"""
+
+import random
+from functools import lru_cache
+
+import numpy as np
+
+from .maze import Cell
+
+ALGORITHMS = ("prim", "backtracker", "binary_tree")
+
+_CHUNK = 2048  # number of mazes carved simultaneously by generate_batch(), limits the memory used
+
+
+def generate(width, height, algorithm="prim", seed=None, exit_cell=None):
+    """ Generate a single maze.
+
+        :param int width: number of columns
+        :param int height: number of rows
+        :param str algorithm: one of ALGORITHMS (optional, else randomized Prim's)
+        :param int seed: seed for the random number generator (optional, else unpredictable)
+        :param tuple exit_cell: (col, row) of the exit (optional, else a random cell of the lattice)
+        :return tuple: maze as np.ndarray, exit cell as (col, row) tuple
+    """
+    if algorithm not in ALGORITHMS:
+        raise ValueError("unknown maze generation algorithm {}, use one of {}".format(algorithm, ALGORITHMS))
+    if algorithm == "binary_tree":
+        mazes, exits = generate_batch(1, width, height, algorithm, seed, exit_cell)
+        return mazes[0], tuple(exits[0].tolist())
+
+    rows, cols = _lattice(width, height, exit_cell)
+    rand = random.Random(seed)
+
+    # a plain Python loop is faster than numpy for a single maze
+    passages = _growing_tree(rows, cols, width, rand, newest=(algorithm == "backtracker"))
+
+    maze = np.full((height, width), Cell.OCCUPIED, dtype=np.int8)
+    maze[::2, ::2][:rows, :cols] = Cell.EMPTY
+    maze.flat[passages] = Cell.EMPTY
+
+    if exit_cell is None:
+        exit_index = rand.randrange(1, rows * cols)
+        exit_cell = (2 * (exit_index % cols), 2 * (exit_index // cols))
+    else:
+        _connect(maze[np.newaxis], np.array([exit_cell]))
+
+    return maze, tuple(exit_cell)
+
+
+def generate_batch(n, width, height, algorithm="prim", seed=None, exit_cell=None):
+    """ Generate 'n' mazes of the same size at once.
+
+        The mazes are carved simultaneously, one step in every maze per iteration, using vectorized numpy
+        operations. Generating thousands of mazes takes seconds, see the module documentation for the differences
+        between the algorithms.
+
+        :param int n: number of mazes
+        :param int width: number of columns
+        :param int height: number of rows
+        :param str algorithm: one of ALGORITHMS (optional, else randomized Prim's)
+        :param int seed: seed for the random number generator (optional, else unpredictable)
+        :param tuple exit_cell: (col, row) of the exit in every maze (optional, else a random cell of the lattice)
+        :return tuple: mazes as np.ndarray (n, height, width), exits as np.ndarray (n, 2) of (col, row)
+    """
+    if algorithm not in ALGORITHMS:
+        raise ValueError("unknown maze generation algorithm {}, use one of {}".format(algorithm, ALGORITHMS))
+
+    rows, cols = _lattice(width, height, exit_cell)
+    rng = np.random.default_rng(seed)
+
+    mazes = np.full((n, height, width), Cell.OCCUPIED, dtype=np.int8)
+    mazes[:, ::2, ::2][:, :rows, :cols] = Cell.EMPTY
+
+    if algorithm == "binary_tree":
+        _binary_tree(mazes, rows, cols, rng)
+    else:
+        for start in range(0, n, _CHUNK):
+            _growing_tree_batch(mazes[start:start + _CHUNK], rows, cols, rng, newest=(algorithm == "backtracker"))
+
+    if exit_cell is None:
+        exit_index = rng.integers(1, rows * cols, n)
+        exits = np.stack((2 * (exit_index % cols), 2 * (exit_index // cols)), axis=1)
+    else:
+        exits = np.tile(exit_cell, (n, 1))
+        _connect(mazes, exits)
+
+    return mazes, exits
+
+
+def _lattice(width, height, exit_cell=None):
+    """ Return the number of rows and columns of the lattice the maze is carved on.
+
+        Without an explicit exit cell a random lattice cell other than the start becomes the exit, so the lattice
+        must have at least 2 cells.
+    """
+    if width < 1 or height < 1:
+        raise ValueError("maze size must be at least 1 x 1, not {} x {}".format(width, height))
+    rows, cols = (height + 1) // 2, (width + 1) // 2
+    if exit_cell is None and rows * cols < 2:
+        raise ValueError("a {} x {} maze has room for the start cell only, make it at least 3 x 1 or pass an exit "
+                         "cell".format(width, height))
+    return rows, cols
+
+
+@lru_cache(maxsize=16)
+def _neighbours(rows, cols):
+    """ Per lattice cell the list of its (up to 4) neighbouring lattice cells, cells are numbered row * cols + col. """
+    neighbours = []
+    for r in range(rows):
+        for c in range(cols):
+            cell = r * cols + c
+            neighbours.append([cell + d for d, ok in ((-1, c > 0), (1, c < cols - 1), (-cols, r > 0),
+                                                      (cols, r < rows - 1)) if ok])
+    return neighbours
+
+
+@lru_cache(maxsize=16)
+def _neighbour_table(rows, cols):
+    """ Neighbours as an array (cells, 4), missing neighbours point to an extra cell rows * cols. """
+    table = np.full((rows * cols, 4), rows * cols, dtype=np.int32)
+    for cell, neighbours in enumerate(_neighbours(rows, cols)):
+        table[cell, :len(neighbours)] = neighbours
+    return table
+
+
+def _growing_tree(rows, cols, width, rand, newest):
+    """ Carve a single maze using the growing tree algorithm.
+
+        Starting from (0, 0) a list of active cells is kept. Every iteration a cell is taken from the list and a
+        passage to a random unvisited neighbour is opened, which becomes active as well. Cells without unvisited
+        neighbours are removed from the list in O(1) by swapping them with the last one.
+
+        :param bool newest: take the newest cell (recursive backtracker), else a random one (Prim's)
+        :return list: indices of the opened walls in the flattened maze
+    """
+    neighbours = _neighbours(rows, cols)
+    visited = bytearray(rows * cols)
+    visited[0] = 1
+    active = [0]
+    passages = []
+
+    while active:
+        k = len(active) - 1 if newest else rand.randrange(len(active))
+        cell = active[k]
+        options = [neighbour for neighbour in neighbours[cell] if not visited[neighbour]]
+        if options:
+            neighbour = options[rand.randrange(len(options))] if len(options) > 1 else options[0]
+            visited[neighbour] = 1
+            active.append(neighbour)
+            # the wall is halfway between the positions of both cells in the flattened maze
+            passages.append(_position(cell, cols, width) + _position(neighbour, cols, width) >> 1)
+        else:
+            active[k] = active[-1]
+            active.pop()
+
+    return passages
+
+
+def _growing_tree_batch(mazes, rows, cols, rng, newest):
+    """ Carve the growing tree algorithm into all 'mazes' simultaneously.
+
+        Every maze needs exactly 2 * cells - 1 iterations (each cell is visited once and removed once), so all
+        mazes finish at the same time. See _growing_tree() for the algorithm itself.
+    """
+    n, _, width = mazes.shape
+    cells = rows * cols
+    neighbours = _neighbour_table(rows, cols)
+    position = _position(np.arange(cells + 1), cols, width)
+
+    maze = np.arange(n)
+    visited = np.zeros((n, cells + 1), dtype=bool)
+    visited[:, 0] = True
+    visited[:, cells] = True  # missing neighbours are never an option
+    active = np.zeros((n, cells), dtype=np.int32)
+    length = np.ones(n, dtype=np.int64)
+    flat = mazes.reshape(n, -1)
+
+    for _ in range(2 * cells - 1):
+        k = length - 1 if newest else (rng.random(n) * length).astype(np.int64)
+        cell = active[maze, k]
+        options = neighbours[cell]
+        unvisited = ~visited[maze[:, np.newaxis], options]
+        grow = unvisited.any(axis=1)
+
+        # random unvisited neighbour: the one with the highest random key
+        neighbour = options[maze, np.argmax(unvisited * rng.random((n, 4)), axis=1)]
+
+        # Update all mazes without masking: mazes which do not grow mark the extra cell as visited and open their
+        # current cell which is already empty. Mazes which grow append the neighbour, the others swap-remove k.
+        neighbour = np.where(grow, neighbour, cells)
+        visited[maze, neighbour] = True
+        flat[maze, np.where(grow, (position[cell] + position[neighbour]) >> 1, position[cell])] = Cell.EMPTY
+        active[maze, np.where(grow, length, k)] = np.where(grow, neighbour, active[maze, length - 1])
+        length += np.where(grow, 1, -1)
+
+
+def _binary_tree(mazes, rows, cols, rng):
+    """ Carve all 'mazes' with the binary tree algorithm: every cell opens the wall to the north or to the west.
+
+        Cells in the top row can only open to the west, cells in the left column only to the north. All cells lead
+        to (0, 0), so the maze is perfect. Completely vectorized.
+    """
+    north = rng.random((len(mazes), rows, cols)) < 0.5
+    north[:, 0, :] = False
+    north[:, :, 0] = True
+
+    mazes[:, 1:2 * rows - 1:2, 0:2 * cols - 1:2][north[:, 1:, :]] = Cell.EMPTY
+    west = ~north[:, :, 1:]
+    mazes[:, 0:2 * rows - 1:2, 1:2 * cols - 1:2][west] = Cell.EMPTY
+
+
+def _position(cell, cols, width):
+    """ Index in the flattened maze of lattice cell(s) 'cell'. """
+    return 2 * (cell // cols) * width + 2 * (cell % cols)
+
+
+def _connect(mazes, exits):
+    """ Make sure the exits are reachable by opening an L-shaped passage to the nearest lattice cell.
+
+        :param np.ndarray mazes: mazes (n, height, width), modified in place
+        :param np.ndarray exits: exit per maze as (col, row)
+    """
+    height, width = mazes.shape[1:]
+    for maze, (col, row) in zip(mazes, exits):
+        if not (0 <= col < width and 0 <= row < height):
+            raise ValueError("exit cell at {} is not inside maze".format((col, row)))
+        maze[row, col] = Cell.EMPTY
+        maze[row, col - col % 2] = Cell.EMPTY
+        maze[row - row % 2, col - col % 2] = Cell.EMPTY
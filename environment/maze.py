@@ -1,9 +1,11 @@
 import logging
+from collections import deque
 from enum import Enum, IntEnum
 
-import matplotlib.pyplot as plt
 import numpy as np
 
+from .policy import ParallelPolicyGraph, PolicyGraph
+
 
 class Cell(IntEnum):
     EMPTY = 0  # indicates empty cell where the agent can move to
@@ -44,7 +46,25 @@ class Maze:
         This way of storing coordinates is in line with what matplotlib's plot() function expects as inputs. The maze
         itself is stored as a 2D numpy array so cells are accessed via [row, col]. To convert a (col, row) tuple
         to (row, col) use (col, row)[::-1]
+
+        Internally, and in the transition table, cells are numbered row * ncols + col (the cell index). In compact
+        mode reset() and step() return this cell index as the state instead of a new [[col, row]] array. The empty
+        cells (all possible start cells) are available as a numpy array of cell indices in 'empty'.
+
+        Note: before, 'empty' was a list of (col, row) tuples and 'cells' a list of all cells as (col, row) tuples.
+        These lists are still available as the properties 'empty_cells' and 'cells', they are built on every access.
+
+        Creating a maze takes time linear in the number of cells, only vectorized numpy operations are used.
+        Resetting takes constant time, also on mazes with millions of cells.
+
+        The maze itself is headless, step() and reset() contain no rendering code. Rendering is done by a
+        MazeRenderer which is attached as an observer via render(); step() and reset() only check whether an
+        observer is attached.
     """
+    __slots__ = ("maze", "empty", "transitions", "action_mask", "exit_index", "compact",
+                 "__minimum_reward", "__exit_cell", "__ncols", "__current", "__total_reward", "__visited", "__episode",
+                 "__policy_graph", "__policy_model", "__parallel_graph", "__renderer", "__observer", "__distance")
+
     actions = [Action.MOVE_LEFT, Action.MOVE_RIGHT, Action.MOVE_UP, Action.MOVE_DOWN]  # all possible actions
 
     reward_exit = 10.0  # reward for reaching the exit cell
@@ -52,106 +72,160 @@ class Maze:
     penalty_visited = -0.25  # penalty for returning to a cell which was visited earlier
     penalty_impossible_move = -0.75  # penalty for trying to enter an occupied cell or moving out of the maze
 
-    def __init__(self, maze, start_cell=(0, 0), exit_cell=None):
+    def __init__(self, maze, start_cell=(0, 0), exit_cell=None, compact=False):
         """ Create a new maze game.
 
             :param numpy.array maze: 2D array containing empty cells (= 0) and cells occupied with walls (= 1)
             :param tuple start_cell: starting cell for the agent in the maze (optional, else upper left)
             :param tuple exit_cell: exit cell which the agent has to reach (optional, else lower right)
+            :param bool compact: observe the agents location as a cell index (optional, else as [[col, row]] array)
         """
         self.maze = maze
+        self.compact = compact
 
         self.__minimum_reward = -0.5 * self.maze.size  # stop game if accumulated reward is below this threshold
 
         nrows, ncols = self.maze.shape
-        self.cells = [(col, row) for col in range(ncols) for row in range(nrows)]
-        self.empty = [(col, row) for col in range(ncols) for row in range(nrows) if self.maze[row, col] == Cell.EMPTY]
-        self.__exit_cell = (ncols - 1, nrows - 1) if exit_cell is None else exit_cell
-        self.empty.remove(self.__exit_cell)
+        self.__ncols = ncols
+        self.__exit_cell = (ncols - 1, nrows - 1) if exit_cell is None else tuple(exit_cell)
 
         # Check for impossible maze layout
-        if self.__exit_cell not in self.cells:
+        if not (0 <= self.__exit_cell[0] < ncols and 0 <= self.__exit_cell[1] < nrows):
             raise Exception("Error: exit cell at {} is not inside maze".format(self.__exit_cell))
         if self.maze[self.__exit_cell[::-1]] == Cell.OCCUPIED:
             raise Exception("Error: exit cell at {} is not free".format(self.__exit_cell))
 
-        # Variables for rendering using Matplotlib
-        self.__render = Render.NOTHING  # what to render
-        self.__ax1 = None  # axes for rendering the moves
-        self.__ax2 = None  # axes for rendering the best action per cell
+        self.exit_index = self.__exit_cell[1] * ncols + self.__exit_cell[0]  # index of the exit cell
+
+        self.empty = np.flatnonzero(self.maze == Cell.EMPTY)  # indices of all empty cells except the exit
+        self.empty = self.empty[self.empty != self.exit_index]
+
+        # Transition table, built once so a step only needs a lookup. Cells are numbered row * ncols + col.
+        # transitions[cell, action] is the index of the cell the action leads to, or -1 if the move is impossible.
+        # action_mask[cell] has bit 'action' set for every possible action from the cell.
+
+        index = np.arange(self.maze.size).reshape(nrows, ncols)
+        index[self.maze != Cell.EMPTY] = -1  # occupied cells cannot be entered
+
+        transitions = np.full((nrows, ncols, len(Maze.actions)), -1, dtype=int)
+        transitions[:, 1:, Action.MOVE_LEFT] = index[:, :-1]
+        transitions[:, :-1, Action.MOVE_RIGHT] = index[:, 1:]
+        transitions[1:, :, Action.MOVE_UP] = index[:-1, :]
+        transitions[:-1, :, Action.MOVE_DOWN] = index[1:, :]
+
+        self.transitions = transitions.reshape(-1, len(Maze.actions))
+        self.action_mask = ((self.transitions >= 0) << np.arange(len(Maze.actions))).sum(axis=1).astype(np.uint8)
+
+        self.__policy_graph = PolicyGraph(self)  # outcome of the greedy policy per cell, used by check_win_all()
+        self.__policy_model = None  # model for which the policy graph was built, and its q_version at the time
+        self.__parallel_graph = None  # worker pool for check_win_all(processes=...), created when first used
+
+        # visited cells by cell index: a cell was visited during the current game if it holds the current episode
+        # number, so a reset only needs to increase the episode number
+        self.__visited = np.zeros(self.maze.size, dtype=np.uint32)
+        self.__episode = 0
+
+        self.__renderer = None  # MazeRenderer created by render(), if any
+        self.__observer = None  # notified after every reset() and step(), see observe()
+
+        self.__distance = None  # number of moves to the exit per cell index, computed when first needed
 
         self.reset(start_cell)
 
     def reset(self, start_cell=(0, 0)):
         """ Reset the maze to its initial state and place the agent at start_cell.
 
-            :param tuple start_cell: here the agent starts its journey through the maze (optional, else upper left)
+            :param start_cell: (col, row) tuple or cell index where the agent starts (optional, else upper left)
             :return: new state after reset
         """
-        if start_cell not in self.cells:
+        if type(start_cell) is tuple:
+            col, row = start_cell
+            inside = 0 <= col < self.__ncols and 0 <= row < self.maze.shape[0]
+            index = row * self.__ncols + col
+        else:
+            index = int(start_cell)
+            inside = 0 <= index < self.maze.size
+
+        if not inside:
             raise Exception("Error: start cell at {} is not inside maze".format(start_cell))
-        if self.maze[start_cell[::-1]] == Cell.OCCUPIED:
+        if self.maze.item(index) == Cell.OCCUPIED:
             raise Exception("Error: start cell at {} is not free".format(start_cell))
-        if start_cell == self.__exit_cell:
+        if index == self.exit_index:
             raise Exception("Error: start- and exit cell cannot be the same {}".format(start_cell))
 
-        self.__previous_cell = self.__current_cell = start_cell
+        self.__current = index
         self.__total_reward = 0.0  # accumulated reward
-        self.__visited = set()  # a set() only stores unique values
-
-        if self.__render in (Render.TRAINING, Render.MOVES):
-            # render the maze
-            nrows, ncols = self.maze.shape
-            self.__ax1.clear()
-            self.__ax1.set_xticks(np.arange(0.5, nrows, step=1))
-            self.__ax1.set_xticklabels([])
-            self.__ax1.set_yticks(np.arange(0.5, ncols, step=1))
-            self.__ax1.set_yticklabels([])
-            self.__ax1.grid(True)
-            self.__ax1.plot(*self.__current_cell, "rs", markersize=30)  # start is a big red square
-            self.__ax1.text(*self.__current_cell, "Start", ha="center", va="center", color="white")
-            self.__ax1.plot(*self.__exit_cell, "gs", markersize=30)  # exit is a big green square
-            self.__ax1.text(*self.__exit_cell, "Exit", ha="center", va="center", color="white")
-            self.__ax1.imshow(self.maze, cmap="binary")
-            self.__ax1.get_figure().canvas.draw()
-            self.__ax1.get_figure().canvas.flush_events()
-
-        return self.__observe()
-
-    def __draw(self):
-        """ Draw a line from the agents previous cell to its current cell. """
-        self.__ax1.plot(*zip(*[self.__previous_cell, self.__current_cell]), "bo-")  # previous cells are blue dots
-        self.__ax1.plot(*self.__current_cell, "ro")  # current cell is a red dot
-        self.__ax1.get_figure().canvas.draw()
-        self.__ax1.get_figure().canvas.flush_events()
-
-    def render(self, content=Render.NOTHING):
+
+        self.__episode += 1  # forget all visited cells
+        if self.__episode > np.iinfo(self.__visited.dtype).max:
+            self.__visited.fill(0)
+            self.__episode = 1
+
+        state = self.__observe()
+        if self.__observer is not None:
+            self.__observer.on_reset(state)
+        return state
+
+    @property
+    def exit_cell(self):
+        """ The (col, row) cell the agent has to reach. """
+        return self.__exit_cell
+
+    @property
+    def cells(self):
+        """ All cells as (col, row) tuples, column by column. """
+        nrows, ncols = self.maze.shape
+        return [(col, row) for col in range(ncols) for row in range(nrows)]
+
+    @property
+    def empty_cells(self):
+        """ All empty cells except the exit as (col, row) tuples, column by column. Same cells as 'empty'. """
+        rows, cols = np.divmod(self.empty, self.__ncols)
+        order = np.lexsort((rows, cols))
+        return list(zip(cols[order].tolist(), rows[order].tolist()))
+
+    def distance_to_exit(self):
+        """ Return the minimal number of moves from every cell to the exit.
+
+            Computed once with a breadth-first search starting at the exit (moves are symmetric, so walking back
+            from the exit gives the same distances) and cached.
+
+            :return np.ndarray: number of moves per cell index, -1 for occupied cells and cells without path to the exit
+        """
+        if self.__distance is None:
+            transitions = self.transitions.tolist()
+            distance = [-1] * self.maze.size
+            distance[self.exit_index] = 0
+
+            queue = deque([self.exit_index])
+            while queue:
+                cell = queue.popleft()
+                for neighbour in transitions[cell]:
+                    if neighbour >= 0 and distance[neighbour] < 0:
+                        distance[neighbour] = distance[cell] + 1
+                        queue.append(neighbour)
+
+            self.__distance = np.array(distance, dtype=int)
+
+        return self.__distance
+
+    def render(self, content=Render.NOTHING, fps=30):
         """ Record what will be rendered during play and/or training.
 
+            Rendering anything else than NOTHING attaches a MazeRenderer to the maze, NOTHING detaches it.
+
             :param Render content: NOTHING, TRAINING, MOVES
+            :param float fps: maximum number of redraws per second (optional, None is no limit)
         """
-        self.__render = content
-
-        if self.__render == Render.NOTHING:
-            if self.__ax1:
-                plt.close(self.__ax1.get_figure())
-                self.__ax1 = None
-            if self.__ax2:
-                plt.close(self.__ax2.get_figure())
-                self.__ax2 = None
-        if self.__render == Render.TRAINING:
-            if self.__ax2 is None:
-                fig, self.__ax2 = plt.subplots(1, 1, tight_layout=True)
-                # No need to set the window title
-                self.__ax2.set_axis_off()
-                self.render_q(None)
-        if self.__render in (Render.MOVES, Render.TRAINING):
-            if self.__ax1 is None:
-                fig, self.__ax1 = plt.subplots(1, 1, tight_layout=True)
-                # No need to set the window title
-
-        plt.show(block=False)
+        if self.__renderer is not None:
+            self.__renderer.close()
+            self.__renderer = None
+
+        if content in (Render.MOVES, Render.TRAINING):
+            from .render import MazeRenderer  # Matplotlib is only needed when rendering
 
+            self.__renderer = MazeRenderer(self, content, fps)
+            self.__renderer.attach()
 
     def step(self, action):
         """ Move the agent according to 'action' and return the new state, reward and game status.
@@ -164,81 +238,66 @@ class Maze:
         status = self.__status()
         state = self.__observe()
         logging.debug("action: {:10s} | reward: {: .2f} | status: {}".format(Action(action).name, reward, status))
+        if self.__observer is not None:
+            self.__observer.on_step(state)
         return state, reward, status
 
+    def observe(self, observer):
+        """ Attach an observer which is notified of every game played, or detach it with None.
+
+            After every reset() the observer's on_reset(state) is called, after every step() its on_step(state),
+            with the state as returned by reset() and step().
+
+            :param observer: object with on_reset() and on_step() methods, for example a MazeRenderer (or None)
+        """
+        self.__observer = observer
+
     def __execute(self, action):
         """ Execute action and collect the reward or penalty.
 
             :param Action action: direction in which the agent will move
             :return float: reward or penalty which results from the action
         """
-        possible_actions = self.__possible_actions(self.__current_cell)
+        next_cell = self.transitions.item(self.__current, action)
 
-        if not possible_actions:
-            reward = self.__minimum_reward - 1  # cannot move anywhere, force end of game
-        elif action in possible_actions:
-            col, row = self.__current_cell
-            if action == Action.MOVE_LEFT:
-                col -= 1
-            elif action == Action.MOVE_UP:
-                row -= 1
-            if action == Action.MOVE_RIGHT:
-                col += 1
-            elif action == Action.MOVE_DOWN:
-                row += 1
-
-            self.__previous_cell = self.__current_cell
-            self.__current_cell = (col, row)
-
-            if self.__render != Render.NOTHING:
-                self.__draw()
-
-            if self.__current_cell == self.__exit_cell:
+        if next_cell >= 0:
+            self.__current = next_cell
+
+            if next_cell == self.exit_index:
                 reward = Maze.reward_exit  # maximum reward when reaching the exit cell
-            elif self.__current_cell in self.__visited:
+            elif self.__visited.item(next_cell) == self.__episode:
                 reward = Maze.penalty_visited  # penalty when returning to a cell which was visited earlier
             else:
                 reward = Maze.penalty_move  # penalty for a move which did not result in finding the exit cell
 
-            self.__visited.add(self.__current_cell)
+            self.__visited[next_cell] = self.__episode
+        elif self.action_mask.item(self.__current) == 0:
+            reward = self.__minimum_reward - 1  # cannot move anywhere, force end of game
         else:
             reward = Maze.penalty_impossible_move  # penalty for trying to enter an occupied cell or move out of the maze
 
         return reward
 
-    def __possible_actions(self, cell=None):
-        """ Create a list with all possible actions from 'cell', avoiding the maze's edges and walls.
+    def index(self, state):
+        """ Return the cell index of 'state'.
 
-            :param tuple cell: location of the agent (optional, else use current cell)
-            :return list: all possible actions
+            :param state: cell index, (col, row) tuple or [[col, row]] array as returned by step()
+            :return int: cell index (row * ncols + col)
         """
-        if cell is None:
-            col, row = self.__current_cell
-        else:
-            col, row = cell
-
-        possible_actions = Maze.actions.copy()  # initially allow all
-
-        # now restrict the initial list by removing impossible actions
-        nrows, ncols = self.maze.shape
-        if row == 0 or (row > 0 and self.maze[row - 1, col] == Cell.OCCUPIED):
-            possible_actions.remove(Action.MOVE_UP)
-        if row == nrows - 1 or (row < nrows - 1 and self.maze[row + 1, col] == Cell.OCCUPIED):
-            possible_actions.remove(Action.MOVE_DOWN)
-
-        if col == 0 or (col > 0 and self.maze[row, col - 1] == Cell.OCCUPIED):
-            possible_actions.remove(Action.MOVE_LEFT)
-        if col == ncols - 1 or (col < ncols - 1 and self.maze[row, col + 1] == Cell.OCCUPIED):
-            possible_actions.remove(Action.MOVE_RIGHT)
-
-        return possible_actions
+        if type(state) is int:
+            return state
+        if type(state) is tuple:
+            return state[1] * self.__ncols + state[0]
+        if state.size == 1:
+            return state.item()
+        return state.item(1) * self.__ncols + state.item(0)
 
     def __status(self):
         """ Return the game status.
 
             :return Status: current game status (WIN, LOSE, PLAYING)
         """
-        if self.__current_cell == self.__exit_cell:
+        if self.__current == self.exit_index:
             return Status.WIN
 
         if self.__total_reward < self.__minimum_reward:  # force end of game after too much loss
@@ -249,15 +308,19 @@ class Maze:
     def __observe(self):
         """ Return the state of the maze - in this game the agents current location.
 
-            :return numpy.array [1][2]: agents current location
+            :return numpy.array [1][2]: agents current location, or its cell index in compact mode
         """
-        return np.array([[*self.__current_cell]])
+        if self.compact:
+            return self.__current
+
+        row, col = divmod(self.__current, self.__ncols)
+        return np.array([[col, row]])
 
     def play(self, model, start_cell=(0, 0)):
         """ Play a single game, choosing the next move based a prediction from 'model'.
 
             :param class AbstractModel model: the prediction model to use
-            :param tuple start_cell: agents initial cell (optional, else upper left)
+            :param start_cell: agents initial cell as (col, row) tuple or cell index (optional, else upper left)
             :return Status: WIN, LOSE
         """
         self.reset(start_cell)
@@ -270,21 +333,61 @@ class Maze:
             if status in (Status.WIN, Status.LOSE):
                 return status
 
-    def check_win_all(self, model):
-        """ Check if the model wins from all possible starting cells. """
-        previous = self.__render
-        self.__render = Render.NOTHING  # avoid rendering anything during execution of the check games
+    def check_win_all(self, model, changed=None, replay=False, processes=None):
+        """ Check if the model wins from all possible starting cells.
 
-        win = 0
-        lose = 0
+            For models which play greedily (model.greedy, the tabular models) the greedy policy derived from
+            model.q_grid() is evaluated in one pass over a policy graph (see PolicyGraph), which gives the same
+            outcome as playing a game from every cell, apart from how ties between equally good actions are broken.
+            For all other models, or when 'replay' is set, a full game is played from every cell using
+            model.predict(), as play() does.
 
-        for cell in self.empty:
-            if self.play(model, cell) == Status.WIN:
-                win += 1
+            The policy graph is kept between calls. If the model passes the cells whose q values it changed since
+            its previous check, only the start cells whose greedy path runs through one of these are re-evaluated.
+            This requires that no other q values changed, else the model must increase model.q_version.
+
+            For large mazes 'processes' evaluates the policy graph in parallel, the start cells are divided over a
+            pool of worker processes which follow the greedy successor of every cell, computed once per check into
+            shared memory. The pool is kept for the next check.
+
+            :param class AbstractModel model: the prediction model to use
+            :param set changed: indices of cells with changed q values since the previous check (optional, else all)
+            :param bool replay: play a game from every start cell using model.predict() (optional, else use graph
+                                if the model is greedy)
+            :param int processes: number of worker processes to evaluate the policy graph (optional, else serial)
+            :return bool, float: True if the model wins from all start cells, win rate
+        """
+        if not model.greedy:
+            replay = True
+
+        if processes is not None and replay is False:
+            if self.__parallel_graph is None or self.__parallel_graph.processes != processes:
+                if self.__parallel_graph is not None:
+                    self.__parallel_graph.close()
+                self.__parallel_graph = ParallelPolicyGraph(self, processes)
+            win, lose = self.__parallel_graph.count(model.q_grid())
+        elif replay is False:
+            if changed is None or self.__policy_model != (model, model.q_version):
+                self.__policy_graph.update(model.q_grid())
+                self.__policy_model = (model, model.q_version)
             else:
-                lose += 1
+                self.__policy_graph.update_cells({cell: model.q(cell) for cell in changed})
+            win, lose = self.__policy_graph.count()
+        else:
+            if self.__renderer is not None:
+                self.__renderer.detach()  # avoid rendering anything during execution of the check games
+
+            win = 0
+            lose = 0
 
-        self.__render = previous  # restore previous rendering setting
+            for cell in self.empty.tolist():
+                if self.play(model, cell) == Status.WIN:
+                    win += 1
+                else:
+                    lose += 1
+
+            if self.__renderer is not None:
+                self.__renderer.attach()
 
         logging.info("won: {} | lost: {} | win rate: {:.5f}".format(win, lose, win / (win + lose)))
 
@@ -295,46 +398,11 @@ class Maze:
     def render_q(self, model):
         """ Render the recommended action(s) for each cell as provided by 'model'.
 
+            When rendering TRAINING this also makes the renderer redraw them after every step, so a training loop only
+            needs to call this once.
+
         :param class AbstractModel model: the prediction model to use
         """
-
-        def clip(n):
-            return max(min(1, n), 0)
-
-        if self.__render == Render.TRAINING:
-            nrows, ncols = self.maze.shape
-
-            self.__ax2.clear()
-            self.__ax2.set_xticks(np.arange(0.5, nrows, step=1))
-            self.__ax2.set_xticklabels([])
-            self.__ax2.set_yticks(np.arange(0.5, ncols, step=1))
-            self.__ax2.set_yticklabels([])
-            self.__ax2.grid(True)
-            self.__ax2.plot(*self.__exit_cell, "gs", markersize=30)  # exit is a big green square
-            self.__ax2.text(*self.__exit_cell, "Exit", ha="center", va="center", color="white")
-
-            for cell in self.empty:
-                q = model.q(cell) if model is not None else [0, 0, 0, 0]
-                a = np.nonzero(q == np.max(q))[0]
-
-                for action in a:
-                    dx = 0
-                    dy = 0
-                    if action == Action.MOVE_LEFT:
-                        dx = -0.2
-                    if action == Action.MOVE_RIGHT:
-                        dx = +0.2
-                    if action == Action.MOVE_UP:
-                        dy = -0.2
-                    if action == Action.MOVE_DOWN:
-                        dy = 0.2
-
-                    # color (from red to green) represents the certainty of the preferred action(s)
-                    maxv = 1
-                    minv = -1
-                    color = clip((q[action] - minv) / (maxv - minv))  # normalize in [-1, 1]
-
-                    self.__ax2.arrow(*cell, dx, dy, color=(1 - color, color, 0), head_width=0.2, head_length=0.1)
-
-            self.__ax2.imshow(self.maze, cmap="binary")
-            self.__ax2.get_figure().canvas.draw()
+        if self.__renderer is not None and self.__renderer.content == Render.TRAINING:
+            self.__renderer.model = model
+            self.__renderer.q(model)
@@ -0,0 +1,294 @@
+import multiprocessing
+import os
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+UNKNOWN = 0  # outcome not determined yet
+VISITING = 1  # cell is on the path currently being followed
+WIN = 2
+LOSE = 3
+
+
+def follow(cell, successor, label):
+    """ Follow the greedy path from 'cell' until a cell with a known outcome is reached, and label the path.
+
+        :param int cell: start cell index
+        :param list successor: next cell index per cell under the greedy policy, -1 for an impossible move
+        :param list label: outcome per cell index, updated in place
+        :return int, int: WIN or LOSE, number of cells labeled
+    """
+    path = []
+
+    while label[cell] == UNKNOWN:
+        label[cell] = VISITING
+        path.append(cell)
+        cell = successor[cell]
+        if cell < 0:  # impossible move, the agent keeps bumping into the wall
+            outcome = LOSE
+            break
+    else:
+        outcome = LOSE if label[cell] == VISITING else label[cell]  # VISITING means the path runs in a cycle
+
+    for cell in path:
+        label[cell] = outcome
+
+    return outcome, len(path)
+
+
+class PolicyGraph:
+    """ Outcome of the greedy policy from every cell of a maze, determined without playing any games.
+
+        A greedy policy always chooses the action with the highest q value, so from each cell it leads to exactly
+        one successor cell. Following these successors from a start cell either reaches the exit (win), tries an
+        impossible move and stays put (lose), or runs in a cycle (lose, the penalties eventually end the game).
+        When a path runs into a cell whose outcome is already known that outcome is reused, so labeling all cells
+        takes O(cells) steps in total.
+
+        After training changed the q values of a few cells update_cells() only relabels the cells whose greedy path
+        passes through a cell with a changed action; the labels of all other cells are still valid.
+
+        Ties between actions with the same q value are broken by taking the first action, not randomly as
+        model.predict() does.
+    """
+
+    def __init__(self, game):
+        """ Create the policy graph for 'game'.
+
+            :param class Maze game: maze game object
+        """
+        self.transitions = game.transitions
+        self.exit_index = game.exit_index
+
+        self.start_cells = game.empty.tolist()
+
+        self.policy = None  # greedy action per cell index
+        self.successor = None  # next cell index per cell under the greedy policy, -1 for an impossible move
+        self.label = None  # outcome per cell index (UNKNOWN, WIN, LOSE)
+        self.wins = 0  # number of start cells labeled WIN
+
+    def update(self, q):
+        """ Build the successor graph for the greedy policy given by 'q' and label all start cells.
+
+            :param np.ndarray q: q values per cell index and action, shape (cells, actions)
+        """
+        policy = np.argmax(q, axis=1)
+        self.policy = policy.tolist()
+        self.successor = self.transitions[np.arange(len(policy)), policy].tolist()
+        self.successor[self.exit_index] = self.exit_index  # the game ends at the exit
+
+        self.label = [UNKNOWN] * len(self.successor)
+        self.label[self.exit_index] = WIN
+        self.wins = 0
+
+        for cell in self.start_cells:
+            self.__follow(cell)
+
+    def update_cells(self, q):
+        """ Update the greedy action of some cells and relabel only the cells whose outcome may have changed.
+
+            :param dict q: q values per cell index, for the cells whose q values changed since the last update
+        """
+        changed = []
+        for cell, values in q.items():
+            action = int(np.argmax(values))
+            if action != self.policy[cell] and cell != self.exit_index:
+                changed.append((cell, action))
+
+        if not changed:
+            return
+
+        # invalidate every cell whose greedy path passes through a changed cell, these are found by walking the
+        # graph backwards; the predecessors of a cell are among its neighbours as moves are symmetric
+        label = self.label
+        successor = self.successor
+        transitions = self.transitions
+        stack = [cell for cell, _ in changed if label[cell] != UNKNOWN]
+        for cell in stack:
+            self.wins -= label[cell] == WIN
+            label[cell] = UNKNOWN
+
+        while stack:
+            cell = stack.pop()
+            for neighbour in transitions[cell].tolist():
+                if neighbour >= 0 and successor[neighbour] == cell and label[neighbour] != UNKNOWN:
+                    self.wins -= label[neighbour] == WIN
+                    label[neighbour] = UNKNOWN
+                    stack.append(neighbour)
+
+        for cell, action in changed:
+            self.policy[cell] = action
+            successor[cell] = transitions.item(cell, action)
+
+        for cell in self.start_cells:
+            if label[cell] == UNKNOWN:
+                self.__follow(cell)
+
+    def __follow(self, cell):
+        """ Label the greedy path from 'cell' and keep the number of wins up to date. """
+        outcome, labeled = follow(cell, self.successor, self.label)
+        if outcome == WIN:
+            self.wins += labeled
+
+    def path_lengths(self):
+        """ Return the number of moves the greedy policy needs to reach the exit, for every cell.
+
+            :return np.ndarray: number of moves per cell index, -1 if the greedy policy does not reach the exit
+        """
+        label = self.label
+        successor = self.successor
+        length = [-1] * len(label)
+        length[self.exit_index] = 0
+
+        for cell in self.start_cells:
+            path = []
+            while length[cell] < 0 and label[cell] == WIN:
+                path.append(cell)
+                cell = successor[cell]
+            n = length[cell]
+            for cell in reversed(path):
+                n += 1
+                length[cell] = n
+
+        return np.array(length, dtype=int)
+
+    def count(self):
+        """ Count the start cells from which the greedy policy wins and loses.
+
+            :return int, int: number of wins, number of losses
+        """
+        return self.wins, len(self.start_cells) - self.wins
+
+
+_worker = dict()  # shared arrays of a ParallelPolicyGraph worker process, set by _attach()
+
+
+def _attach(blocks):
+    """ Initialize a worker process: attach to the shared memory blocks of the coordinator.
+
+        The successor and label arrays are accessed through memoryviews, reading and writing single items of
+        these is much faster than of numpy arrays.
+
+        :param dict blocks: (shared memory name, shape, dtype) per array name
+    """
+    for name, (block, shape, dtype) in blocks.items():
+        memory = shared_memory.SharedMemory(name=block)
+        _worker[name + "_memory"] = memory  # keep a reference, else the memory is released
+        _worker[name] = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+    _worker["successor_view"] = _worker["successor_memory"].buf.cast("q")
+    _worker["label_view"] = _worker["label_memory"].buf.cast("b")
+
+
+def _count_wins(start, stop):
+    """ Label the greedy paths from the start cells start:stop and count the wins. Runs in a worker process.
+
+        The labels are shared by all workers, so a path which runs into a cell labeled by another worker stops
+        there. Only WIN and LOSE are written to the shared labels; the cells on the path currently being followed
+        are kept by the worker itself, as another worker may be following a path through the same cells.
+
+        :param int start: first start cell of the shard
+        :param int stop: end of the shard (exclusive)
+        :return int: number of start cells in the shard from which the greedy policy wins
+    """
+    successor = _worker["successor_view"]
+    label = _worker["label_view"]
+
+    wins = 0
+    for cell in _worker["start_cells"][start:stop].tolist():
+        outcome = label[cell]
+        if outcome == UNKNOWN:
+            path = []
+            visiting = set()
+            while True:
+                visiting.add(cell)
+                path.append(cell)
+                cell = successor[cell]
+                if cell < 0 or cell in visiting:  # impossible move or cycle
+                    outcome = LOSE
+                    break
+                if label[cell] != UNKNOWN:
+                    outcome = label[cell]
+                    break
+            for cell in path:
+                label[cell] = outcome
+        if outcome == WIN:
+            wins += 1
+
+    return wins
+
+
+class ParallelPolicyGraph:
+    """ Outcome of the greedy policy from every start cell, evaluated by a pool of worker processes.
+
+        The coordinator computes the successor of every cell under the greedy policy once per evaluation, with a
+        few numpy operations, into shared memory. The start cells are split in contiguous shards, one per task.
+        Every worker follows the greedy paths from the start cells of its shard, the same way PolicyGraph does,
+        and returns the number of wins. The outcome labels are shared as well, so a path which runs into a cell
+        labeled by any worker is not followed again. Only the shard boundaries are sent to the workers. The pool
+        and shared memory are created once and reused for every evaluation.
+    """
+
+    def __init__(self, game, processes=None):
+        """ Create the worker pool for 'game'.
+
+            :param class Maze game: maze game object
+            :param int processes: number of worker processes (optional, else one per cpu)
+        """
+        start_cells = game.empty
+
+        self.processes = processes or multiprocessing.cpu_count()
+        self.shards = self.processes * 4  # a few shards per worker evens out differences in path length
+
+        self.__memory = []
+        blocks = dict()
+        arrays = dict()
+        for name, shape, dtype in (("successor", (game.maze.size,), np.int64),
+                                   ("label", (game.maze.size,), np.int8),
+                                   ("start_cells", start_cells.shape, start_cells.dtype)):
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+            self.__memory.append(memory)
+            blocks[name] = (memory.name, shape, dtype)
+            arrays[name] = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+        arrays["start_cells"][:] = start_cells
+        self.__successor = arrays["successor"]
+        self.__label = arrays["label"]
+        self.__start_cells = len(start_cells)
+        self.__transitions = game.transitions
+        self.__exit_index = game.exit_index
+
+        self.__pool = multiprocessing.Pool(self.processes, initializer=_attach, initargs=(blocks,))
+        self.__finalizer = weakref.finalize(self, ParallelPolicyGraph.__release, self.__pool, self.__memory,
+                                            os.getpid())
+
+    @staticmethod
+    def __release(pool, memory, pid):
+        if os.getpid() != pid:  # a forked child process inherited this object, the pool is not its to stop
+            return
+        pool.terminate()
+        pool.join()
+        for block in memory:
+            block.close()
+            block.unlink()
+
+    def close(self):
+        """ Stop the worker processes and release the shared memory. """
+        self.__finalizer()
+
+    def count(self, q):
+        """ Count the start cells from which the greedy policy given by 'q' wins and loses.
+
+            :param np.ndarray q: q values per cell index and action, shape (cells, actions)
+            :return int, int: number of wins, number of losses
+        """
+        self.__successor[:] = self.__transitions[np.arange(len(self.__successor)), np.argmax(q, axis=1)]
+        self.__label[:] = UNKNOWN
+        self.__label[self.__exit_index] = WIN
+
+        bounds = np.linspace(0, self.__start_cells, min(self.shards, self.__start_cells) + 1, dtype=int).tolist()
+        shards = list(zip(bounds[:-1], bounds[1:]))
+        wins = sum(self.__pool.starmap(_count_wins, shards))
+
+        return wins, self.__start_cells - wins
@@ -0,0 +1,245 @@
+import time
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from .maze import Action, Render
+
+
+class Blit:
+    """ Redraw the animated artists of an axes on top of a cached background, instead of redrawing the whole figure.
+
+        The background (everything which is not animated) is captured whenever the figure is fully drawn, for
+        example after a resize. update() restores it and draws only the animated artists on top. Updates are
+        skipped if they come faster than 'fps' per second; the artists keep their latest state so the next update
+        shows it.
+    """
+
+    def __init__(self, ax, fps=None):
+        """ Create a new blit manager for 'ax'.
+
+            :param matplotlib.axes.Axes ax: axes containing the animated artists
+            :param float fps: maximum number of redraws per second (optional, else no limit)
+        """
+        self.ax = ax
+        self.canvas = ax.get_figure().canvas
+        self.artists = []
+
+        self.__interval = 0 if fps is None else 1 / fps  # minimum number of seconds between redraws
+        self.__last_update = 0.0  # time of the last redraw
+        self.__background = None
+
+        self.canvas.mpl_connect("draw_event", self.__on_draw)
+
+    def add(self, artist):
+        """ Register an artist which is redrawn on every update. """
+        artist.set_animated(self.canvas.supports_blit)  # without blitting support the artist is drawn normally
+        self.artists.append(artist)
+        return artist
+
+    def due(self):
+        """ Return True if enough time has passed since the last redraw. """
+        return time.perf_counter() - self.__last_update >= self.__interval
+
+    def draw(self):
+        """ Fully redraw the figure and capture the new background. """
+        self.__background = None
+        self.update(force=True)
+
+    def update(self, force=False):
+        """ Redraw the animated artists, unless the last redraw was too recent.
+
+            :param bool force: redraw regardless of the fps limit
+        """
+        if not force and not self.due():
+            return
+
+        if self.__background is None or not self.canvas.supports_blit:
+            self.canvas.draw()  # triggers __on_draw which captures the background
+        else:
+            self.canvas.restore_region(self.__background)
+            self.__draw_artists()
+            self.canvas.blit(self.ax.bbox)
+
+        self.canvas.flush_events()
+        self.__last_update = time.perf_counter()
+
+    def __on_draw(self, event):
+        """ Capture the background after a full draw and put the animated artists back on top. """
+        if self.canvas.supports_blit:
+            self.__background = self.canvas.copy_from_bbox(self.ax.bbox)
+            self.__draw_artists()
+
+    def __draw_artists(self):
+        for artist in self.artists:
+            if artist.get_visible():
+                self.ax.draw_artist(artist)
+
+
+class MazeRenderer:
+    """ Draws a maze, the agents moves and the best action(s) per cell using Matplotlib.
+
+        The renderer is an observer: once attached (see Maze.observe()) the maze calls on_reset() and on_step() so
+        every game which is played is drawn. Maze itself does not contain any rendering code, a maze without a
+        renderer attached runs headless at full speed. Normally a renderer is attached and detached via
+        Maze.render().
+
+        The maze, grid and exit are drawn once as a background. The agents path and the arrows for the best actions
+        are created once as well and only the ones which changed are updated, after which they are blitted onto the
+        background. The number of redraws per second is limited to 'fps'.
+    """
+
+    def __init__(self, game, content, fps=30):
+        """ Create a new renderer for 'game'.
+
+            :param class Maze game: maze game object to render
+            :param Render content: TRAINING (moves and best actions) or MOVES (moves only)
+            :param float fps: maximum number of redraws per second (optional, None is no limit)
+        """
+        self.game = game
+        self.content = content
+        self.model = None  # model whose best actions are drawn after every step, see q()
+
+        self.__current_cell = None  # cell where the agent was at the previous step
+
+        self.__ax1 = None  # axes for rendering the moves
+        self.__ax2 = None  # axes for rendering the best action per cell
+
+        if self.content == Render.TRAINING:
+            fig, self.__ax2 = plt.subplots(1, 1, tight_layout=True)
+            # No need to set the window title
+            self.__ax2.set_axis_off()
+            self.__blit2 = Blit(self.__ax2, fps)
+            self.__draw_background(self.__ax2)
+            self.__create_arrows()
+            self.q(None)
+        if self.content in (Render.MOVES, Render.TRAINING):
+            fig, self.__ax1 = plt.subplots(1, 1, tight_layout=True)
+            # No need to set the window title
+            self.__blit1 = Blit(self.__ax1, fps)
+            self.__start, = self.__ax1.plot([], [], "rs", markersize=30)  # start is a big red square
+            self.__start_text = self.__ax1.text(0, 0, "Start", ha="center", va="center", color="white")
+            self.__draw_background(self.__ax1)
+            self.__path = self.__blit1.add(self.__ax1.plot([], [], "bo-")[0])  # previous cells are blue dots
+            self.__current = self.__blit1.add(self.__ax1.plot([], [], "ro")[0])  # current cell is a red dot
+
+        plt.show(block=False)
+
+    def attach(self):
+        """ Start observing the maze. """
+        self.game.observe(self)
+
+    def detach(self):
+        """ Stop observing the maze, it runs headless again. """
+        self.game.observe(None)
+
+    def on_reset(self, state):
+        """ Called by the maze after reset(), draw the new start cell. """
+        self.reset(self.__cell(state))
+
+    def on_step(self, state):
+        """ Called by the maze after step(), draw the move and the changed best actions. """
+        cell = self.__cell(state)
+        if cell != self.__current_cell:
+            self.move(self.__current_cell, cell)
+        if self.model is not None:
+            self.q(self.model)
+
+    def close(self):
+        """ Detach from the maze and close the figures. """
+        self.detach()
+        if self.__ax1:
+            plt.close(self.__ax1.get_figure())
+            self.__ax1 = None
+        if self.__ax2:
+            plt.close(self.__ax2.get_figure())
+            self.__ax2 = None
+
+    def __cell(self, state):
+        """ Convert a state as returned by the maze to a (col, row) tuple. """
+        row, col = divmod(self.game.index(state), self.game.maze.shape[1])
+        return col, row
+
+    def __draw_background(self, ax):
+        """ Draw the parts which never change: grid, maze and exit. """
+        nrows, ncols = self.game.maze.shape
+        ax.set_xticks(np.arange(0.5, nrows, step=1))
+        ax.set_xticklabels([])
+        ax.set_yticks(np.arange(0.5, ncols, step=1))
+        ax.set_yticklabels([])
+        ax.grid(True)
+        ax.plot(*self.game.exit_cell, "gs", markersize=30)  # exit is a big green square
+        ax.text(*self.game.exit_cell, "Exit", ha="center", va="center", color="white")
+        ax.imshow(self.game.maze, cmap="binary")
+
+    def __create_arrows(self):
+        """ Create an (invisible) arrow per action for every empty cell, q() shows and colors them. """
+        ncols = self.game.maze.shape[1]
+        delta = {Action.MOVE_LEFT: (-0.2, 0), Action.MOVE_RIGHT: (0.2, 0), Action.MOVE_UP: (0, -0.2),
+                 Action.MOVE_DOWN: (0, 0.2)}
+
+        self.__cells = self.game.empty
+        self.__arrows = [[self.__blit2.add(self.__ax2.arrow(cell % ncols, cell // ncols, *delta[action],
+                                                            head_width=0.2, head_length=0.1, visible=False))
+                          for action in self.game.actions] for cell in self.__cells.tolist()]
+
+        # what is currently shown per empty cell: which actions are the best ones, and their color
+        self.__best = np.zeros((len(self.__cells), len(self.game.actions)), dtype=bool)
+        self.__color = np.full((len(self.__cells), len(self.game.actions)), np.nan)
+
+    def reset(self, start_cell):
+        """ Draw the maze with the start cell and clear the agents path.
+
+            :param tuple start_cell: cell where the agent starts
+        """
+        self.__current_cell = start_cell
+
+        self.__start.set_data([start_cell[0]], [start_cell[1]])
+        self.__start_text.set_position(start_cell)
+        self.__path.set_data([start_cell[0]], [start_cell[1]])
+        self.__current.set_data([], [])
+        self.__blit1.draw()  # the start cell is part of the background
+
+    def move(self, previous_cell, current_cell):
+        """ Extend the agents path from its previous cell to its current cell. """
+        self.__current_cell = current_cell
+
+        xdata, ydata = self.__path.get_data()
+        self.__path.set_data([*xdata, current_cell[0]], [*ydata, current_cell[1]])
+        self.__current.set_data([current_cell[0]], [current_cell[1]])
+        self.__blit1.update()
+
+    def q(self, model):
+        """ Draw the recommended action(s) for each cell as provided by 'model'.
+
+            Only the arrows of cells whose best action(s) or their color changed are updated.
+
+        :param class AbstractModel model: the prediction model to use
+        """
+        if self.content != Render.TRAINING or not self.__blit2.due():
+            return
+
+        if model is not None:
+            q = model.q_grid()[self.__cells]
+        else:
+            q = np.zeros(self.__best.shape)
+
+        # color (from red to green) represents the certainty of the preferred action(s)
+        maxv = 1
+        minv = -1
+        best = q == np.max(q, axis=1, keepdims=True)
+        color = np.where(best, np.clip((q - minv) / (maxv - minv), 0, 1), np.nan)  # normalize in [-1, 1]
+        color = np.round(color, 2)  # ignore changes which would not be visible
+
+        changed = np.any(best != self.__best, axis=1) | np.any((color != self.__color) & best, axis=1)
+
+        for i in np.flatnonzero(changed):
+            for action, arrow in enumerate(self.__arrows[i]):
+                arrow.set_visible(best[i, action])
+                if best[i, action]:
+                    arrow.set_color((1 - color[i, action], color[i, action], 0))
+
+        self.__best = best
+        self.__color = color
+
+        self.__blit2.update()
@@ -0,0 +1,111 @@
+import numpy as np
+
+from .maze import Maze, Status
+
+
+class VectorMaze:
+    """ A number of agents moving through the same maze in lockstep.
+
+        Instead of a single agent stepping through a Maze via Python calls, the positions, visited cells and
+        accumulated rewards of all agents are kept in numpy arrays, and step() moves every agent at once using
+        the transition table of the underlying Maze. The rewards and penalties are the same as in Maze, and so is
+        the rule that an agent loses once its accumulated reward drops below -0.5 * maze.size.
+
+        Agents which win or lose are immediately reset to a random start cell, so every agent is always playing.
+        The cell an agent reached before it was reset is available in terminal_state. As in Maze, a cell was
+        visited by an agent during its current game if visited[agent, cell] holds the agent's episode number, so
+        resetting an agent only increases its episode number and takes constant time.
+
+        States are cell indices (row * ncols + col), the same numbering as used in Maze.transitions.
+        Statuses are returned as an array of Status values (Status.WIN.value, Status.LOSE.value, ...).
+    """
+
+    def __init__(self, game, agents, seed=None):
+        """ Create a vectorized copy of 'game'.
+
+            :param class Maze game: maze game object, its layout and exit cell are used by all agents
+            :param int agents: number of agents which move through the maze simultaneously
+            :param int seed: seed for choosing start cells (optional, else unpredictable)
+        """
+        self.transitions = game.transitions
+        self.action_mask = game.action_mask
+        self.exit_index = game.exit_index
+
+        self.__minimum_reward = -0.5 * game.maze.size  # agent loses if accumulated reward is below this threshold
+        self.__rng = np.random.default_rng(seed)
+
+        self.start_cells = game.empty
+
+        self.agents = agents
+        self.__agent = np.arange(agents)  # row index per agent, used for indexing visited
+
+        self.state = np.zeros(agents, dtype=int)  # current cell per agent
+        self.terminal_state = np.zeros(agents, dtype=int)  # cell reached in the last step, before any reset
+        self.total_reward = np.zeros(agents, dtype=float)  # accumulated reward per agent
+        self.visited = np.zeros((agents, game.maze.size), dtype=np.uint16)  # episode number per agent and cell
+        self.episode = np.zeros(agents, dtype=np.uint16)  # current episode number per agent
+
+        self.reset()
+
+    def reset(self, start_cells=None):
+        """ Reset all agents and place them at 'start_cells'.
+
+            :param np.ndarray start_cells: start cell index per agent (optional, else random start cells)
+            :return np.ndarray: new state per agent
+        """
+        if start_cells is None:
+            start_cells = self.__rng.choice(self.start_cells, self.agents)
+
+        self.state[:] = start_cells
+        self.total_reward[:] = 0.0
+        self.__forget(self.__agent)
+
+        return self.state.copy()
+
+    def step(self, actions):
+        """ Move every agent according to its action and return the new states, rewards and game statuses.
+
+            :param np.ndarray actions: action per agent
+            :return np.ndarray, np.ndarray, np.ndarray: state, reward, status per agent
+        """
+        actions = np.asarray(actions)
+        current = self.state
+
+        next_cell = self.transitions[current, actions]
+        moved = next_cell >= 0
+        next_cell = np.where(moved, next_cell, current)
+
+        reward = np.where(moved, Maze.penalty_move, Maze.penalty_impossible_move)
+        reward[moved & (self.visited[self.__agent, next_cell] == self.episode)] = Maze.penalty_visited
+        won = next_cell == self.exit_index
+        reward[won] = Maze.reward_exit
+        reward[self.action_mask[current] == 0] = self.__minimum_reward - 1  # cannot move anywhere, force end of game
+
+        self.visited[self.__agent[moved], next_cell[moved]] = self.episode[moved]
+        self.total_reward += reward
+        self.state[:] = next_cell
+        self.terminal_state[:] = next_cell
+
+        status = np.full(self.agents, Status.PLAYING.value, dtype=np.int8)
+        status[self.total_reward < self.__minimum_reward] = Status.LOSE.value
+        status[won] = Status.WIN.value
+
+        done = np.flatnonzero(status != Status.PLAYING.value)
+        if done.size:  # auto reset finished agents
+            self.state[done] = self.__rng.choice(self.start_cells, done.size)
+            self.total_reward[done] = 0.0
+            self.__forget(done)
+
+        return self.state.copy(), reward, status
+
+    def __forget(self, agents):
+        """ Forget the visited cells of 'agents' by increasing their episode numbers.
+
+            :param np.ndarray agents: indices of the agents which start a new game
+        """
+        episode = self.episode[agents].astype(int) + 1
+        wrapped = episode > np.iinfo(self.episode.dtype).max
+        if wrapped.any():  # rare, only then the visited cells of these agents are cleared
+            self.visited[agents[wrapped]] = 0
+            episode[wrapped] = 1
+        self.episode[agents] = episode
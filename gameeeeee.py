@@ -1,11 +1,9 @@
+import queue
+
 import pygame
 import numpy as np
-import random
-import models
-from environment.maze import Maze
-
-# Initialize Pygame
-pygame.init()
+from levelpool import LevelPool
+from models import PolicyCache
 
 # Define constants
 WIDTH, HEIGHT = 7, 7  # Maze size
@@ -18,43 +16,6 @@ BLUE = (0, 0, 255)
 RED = (255, 0, 0)
 YELLOW = (255, 255, 0)
 
-# Create the screen
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("Maze Game")
-
-# Directions for movement (right, down, left, up)
-DIRECTIONS = [(0, 1), (1, 0), (0, -1), (-1, 0)]
-
-# Function to generate a maze
-def generate_maze(width, height):
-    maze = np.ones((height, width), dtype=int)
-    start_x, start_y = 0, 0
-    maze[start_y][start_x] = 0
-    stack = [(start_x, start_y)]
-    
-    while stack:
-        x, y = stack[-1]
-        neighbors = []
-        
-        for dx, dy in DIRECTIONS:
-            nx, ny = x + dx * 2, y + dy * 2
-            if 0 <= nx < width and 0 <= ny < height and maze[ny][nx] == 1:
-                neighbors.append((nx, ny))
-        
-        if neighbors:
-            nx, ny = random.choice(neighbors)
-            maze[ny - (ny - y)//2][nx - (nx - x)//2] = 0
-            maze[ny][nx] = 0
-            stack.append((nx, ny))
-        else:
-            stack.pop()
-    
-    # Ensure start and end are open
-    maze[0][0] = 0
-    maze[height-1][width-1] = 0
-    
-    return maze, (width - 1, height - 1)
-
 # Function to draw the maze
 def draw_maze(screen, maze, offset_x=0, offset_y=0):
     for y in range(HEIGHT):
@@ -270,23 +231,24 @@ def pause_menu():
                     return "quit_to_menu"
 
 # Main game loop
-def game_loop(ai_move_time):
+def game_loop(ai_move_time, pool):
     running = True
     ai_last_move = pygame.time.get_ticks()  # Initialize the last move time
     player_wins = 0  # Initialize player win counter
     ai_wins = 0  # Initialize AI win counter
 
     while running:
-        # Generate a new maze and reset positions
-        maze, exit_position = generate_maze(WIDTH, HEIGHT)
+        # Take the next maze and its trained AI model from the pool, keep the window responsive while waiting
+        level = None
+        while level is None:
+            try:
+                level = pool.get(timeout=0.05)
+            except queue.Empty:
+                pygame.event.pump()
+        maze, exit_position, q = level
         player_pos = [0, 0]  # Player start position
         ai_pos = [0, 0]  # AI start position
 
-        # Initialize the AI model for the maze
-        game = Maze(maze, exit_cell=exit_position)
-        model = models.SarsaTableTraceModel(game)
-        model.train(discount=0.90, exploration_rate=0.10, learning_rate=0.10, episodes=200, stop_at_convergence=True)
-        
         level_running = True
         while level_running:
             screen.fill(BLACK)
@@ -320,7 +282,7 @@ def game_loop(ai_move_time):
             # AI movement using the SARSA model with a timer delay
             current_time = pygame.time.get_ticks()
             if current_time - ai_last_move >= ai_move_time:
-                ai_action = model.predict(np.array([ai_pos]))
+                ai_action = int(np.argmax(q[ai_pos[1] * WIDTH + ai_pos[0]]))
                 ai_pos = move(ai_pos, ai_action, maze)
                 ai_last_move = current_time
 
@@ -366,14 +328,25 @@ def game_loop(ai_move_time):
 
 
 if __name__ == "__main__":
+    # Initialize Pygame and create the screen, not at import so the level pool's worker processes do not open windows
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("Maze Game")
+
+    # Start generating levels in the background, while the player is still in the menus
+    pool = LevelPool(WIDTH, HEIGHT, algorithm="backtracker", exit_cell=(WIDTH - 1, HEIGHT - 1), cache=PolicyCache(),
+                     discount=0.90, exploration_rate=0.10, learning_rate=0.10, episodes=200, stop_at_convergence=True)
+
     while True:
         main_menu()  # Show the main menu
         ai_move_time = difficulty_menu()  # Get the selected difficulty
         show_tutorial()  # Show the tutorial before the game starts
-        game_active = game_loop(ai_move_time)  # Start the game loop with the chosen difficulty
+        game_active = game_loop(ai_move_time, pool)  # Start the game loop with the chosen difficulty
         
         # If game_active is False, return to main menu
         if not game_active:
             continue  # This will loop back to the main menu
         else:
             break  # If for any reason the game should quit, exit the loop
+
+    pool.close()
@@ -0,0 +1,99 @@
+import multiprocessing
+import os
+import random
+from collections import namedtuple
+
+import numpy as np
+
+import models
+from environment.generator import generate
+from environment.maze import Maze
+
+Level = namedtuple("Level", ["maze", "exit_cell", "q"])  # q is the (cells, actions) q-value grid of the trained model
+
+
+class LevelPool:
+    """ Generates mazes and trains a model for each of them in background processes.
+
+        Generating a maze and training a model takes seconds, too long to do between two levels of a game. The pool
+        keeps a bounded queue of ready levels which is filled by worker processes, so get() normally returns
+        immediately. Workers block when the queue is full and continue as soon as a level is taken.
+
+        A level contains the maze, its exit cell and the q-values of the trained model per cell (index
+        row * ncols + col) and action. The best action for a cell is the argmax over its row of q-values.
+
+        Usage:
+            with LevelPool(7, 7, episodes=200, stop_at_convergence=True) as pool:
+                maze, exit_cell, q = pool.get()
+    """
+
+    def __init__(self, width, height, model=models.SarsaTableTraceModel, size=4, processes=None, seed=None,
+                 algorithm="prim", exit_cell=None, cache=None, **kwargs):
+        """ Create a new pool and start its workers.
+
+            :param int width: number of columns of the mazes
+            :param int height: number of rows of the mazes
+            :param class model: AbstractModel subclass to train for every maze
+            :param int size: maximum number of ready levels waiting in the queue
+            :param int processes: number of worker processes (optional, else one less than the number of cpu's)
+            :param int seed: seed for generating the mazes and training (optional, else unpredictable)
+            :param str algorithm: maze generation algorithm, see environment.generator
+            :param tuple exit_cell: (col, row) of the exit in every maze (optional, else a random cell)
+            :param models.PolicyCache cache: reuse the q-values for mazes which were trained before (optional)
+            :param kwargs: parameters for model.train(), for example episodes and stop_at_convergence
+        """
+        if processes is None:
+            processes = max(1, min(size, (os.cpu_count() or 1) - 1))
+
+        self.__queue = multiprocessing.Queue(maxsize=size)
+        self.__workers = [multiprocessing.Process(target=_produce, daemon=True,
+                                                  args=(self.__queue, seed_sequence, width, height, model, algorithm,
+                                                        exit_cell, cache, kwargs))
+                          for seed_sequence in np.random.SeedSequence(seed).spawn(processes)]
+
+        for worker in self.__workers:
+            worker.start()
+
+    def get(self, timeout=None):
+        """ Take the next ready level from the queue, wait for one if the queue is empty.
+
+            :param float timeout: maximum number of seconds to wait (optional, else wait forever)
+            :return Level: maze, exit cell and q-values
+            :raises queue.Empty: if no level was ready within timeout
+        """
+        return self.__queue.get(timeout=timeout)
+
+    def close(self):
+        """ Stop the workers, levels which are still in the queue are discarded. """
+        for worker in self.__workers:
+            worker.terminate()
+        for worker in self.__workers:
+            worker.join()
+        self.__workers = []
+        self.__queue.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _produce(queue, seed_sequence, width, height, model, algorithm, exit_cell, cache, kwargs):
+    """ Worker process: generate mazes and train a model for each of them, forever. """
+    rng = np.random.default_rng(seed_sequence)
+
+    # the models use the global random generators, make sure the workers do not all inherit the same state
+    random.seed(int(rng.integers(2 ** 32)))
+    np.random.seed(int(rng.integers(2 ** 32)))
+
+    while True:
+        maze, exit_position = generate(width, height, algorithm, seed=int(rng.integers(2 ** 63)), exit_cell=exit_cell)
+
+        trained = model(Maze(maze, exit_cell=exit_position))
+        if cache is None:
+            trained.train(**kwargs)
+        else:
+            cache.load_or_train(trained, **kwargs)
+
+        queue.put(Level(maze, exit_position, trained.q_grid()))
@@ -1,11 +1,13 @@
 import numpy as np
 import random
 import logging
+import time
 from enum import Enum, auto
 import matplotlib.pyplot as plt
 
 import models
-from environment.maze import Maze, Render
+from environment.generator import generate, generate_batch
+from environment.maze import Maze, Render, Status
 
 logging.basicConfig(format="%(levelname)-8s: %(asctime)s: %(message)s",
                     datefmt="%Y-%m-%d %H:%M:%S",
@@ -23,56 +25,21 @@ class Test(Enum):
     LOAD_DEEP_Q = auto()
     SPEED_TEST_1 = auto()
     SPEED_TEST_2 = auto()
+    RENDER_SPEED_TEST = auto()
+    SCALE_TEST = auto()
+    ORACLE_MODEL = auto()
+    POLICY_CACHE = auto()
+    VALUE_ITERATION = auto()
+    DYNA_Q = auto()
+    PRIORITIZED_SWEEPING = auto()
+    LOCKSTEP = auto()
+    HOGWILD = auto()
+    PRIORITIZED_REPLAY = auto()
 
 
 test = Test.SARSA_ELIGIBILITY  # which test to run
 
-def generate_maze(width, height):
-    # Initialize the maze with walls
-    maze = np.ones((height, width), dtype=int)
-
-    # Define the start point
-    start_x, start_y = 0, 0
-
-    # Create the initial path at the start point
-    maze[start_y][start_x] = 0
-    walls = [(start_x, start_y)]
-    
-    while walls:
-        x, y = random.choice(walls)
-        walls.remove((x, y))
-
-        # Check possible neighbors
-        neighbors = []
-        if x > 1 and maze[y][x - 2] == 1:
-            neighbors.append((x - 2, y))
-        if x < width - 2 and maze[y][x + 2] == 1:
-            neighbors.append((x + 2, y))
-        if y > 1 and maze[y - 2][x] == 1:
-            neighbors.append((x, y - 2))
-        if y < height - 2 and maze[y + 2][x] == 1:
-            neighbors.append((x, y + 2))
-        
-        if neighbors:
-            nx, ny = random.choice(neighbors)
-            maze[ny][nx] = 0
-            maze[ny - (ny - y) // 2][nx - (nx - x) // 2] = 0
-            walls.append((nx, ny))
-            walls.append((x, y))
-
-    # Randomly choose an exit point on a path (not on a wall)
-    while True:
-        end_x = random.randint(0, width - 1)
-        end_y = random.randint(0, height - 1)
-        if maze[end_y][end_x] == 0 and (end_x, end_y) != (start_x, start_y):
-            break
-
-    # Ensure the end point is reachable
-    maze[end_y][end_x] = 0
-
-    return maze, (end_x, end_y)
-
-maze, exit_position = generate_maze(9, 9)
+maze, exit_position = generate(9, 9)
 
 game = Maze(maze, exit_cell=exit_position)
 
@@ -87,6 +54,30 @@ if test == Test.RANDOM_MODEL:
     model = models.RandomModel(game)
     game.play(model, start_cell=(0, 0))
 
+# play using the shortest path, and use it to measure how close a trained model gets to the shortest paths
+if test == Test.ORACLE_MODEL:
+    game.render(Render.MOVES)
+    model = models.OracleModel(game)
+    game.play(model, start_cell=(0, 0))
+    game.render(Render.NOTHING)
+
+    trained = models.QTableModel(game)
+    trained.train(discount=0.90, exploration_rate=0.10, learning_rate=0.10, episodes=200, stop_at_convergence=True)
+    win_rate, optimality = model.optimality(trained)
+    logging.info("model: {} | win rate: {:.3f} | shortest / actual path length: {:.3f}"
+                 .format(trained.name, win_rate, optimality))
+
+# train once and store the result in the policy cache, the second time the model is restored from the cache
+if test == Test.POLICY_CACHE:
+    cache = models.PolicyCache()
+    for _ in range(2):
+        model = models.SarsaTableTraceModel(game)
+        start_time = time.perf_counter()
+        restored = cache.load_or_train(model, discount=0.90, exploration_rate=0.10, learning_rate=0.10, episodes=200,
+                                       stop_at_convergence=True)
+        logging.info("restored from cache: {} | time spent: {:.3f} s".format(restored, time.perf_counter() - start_time))
+    game.render(Render.MOVES)
+
 # train using tabular Q-learning
 if test == Test.Q_LEARNING:
     game.render(Render.TRAINING)
@@ -94,6 +85,20 @@ if test == Test.Q_LEARNING:
     h, w, _, _ = model.train(discount=0.90, exploration_rate=0.10, learning_rate=0.10, episodes=200,
                              stop_at_convergence=True)
 
+# train using tabular Q-learning, playing 64 games at once in lockstep
+if test == Test.LOCKSTEP:
+    game.render(Render.TRAINING)
+    model = models.QTableModel(game)
+    h, w, _, _ = model.train(discount=0.90, exploration_rate=0.10, learning_rate=0.10, episodes=2000, agents=64,
+                             stop_at_convergence=True)
+
+# train using tabular Q-learning in 4 worker processes which share the q values
+if test == Test.HOGWILD:
+    game.render(Render.TRAINING)
+    model = models.QTableModel(game)
+    h, w, _, _ = model.train(discount=0.90, exploration_rate=0.10, learning_rate=0.10, episodes=800, workers=4,
+                             check_convergence_every=5, stop_at_convergence=True)
+
 # train using tabular Q-learning and an eligibility trace (aka TD-lambda)
 if test == Test.Q_ELIGIBILITY:
     game.render(Render.TRAINING)
@@ -101,6 +106,20 @@ if test == Test.Q_ELIGIBILITY:
     h, w, _, _ = model.train(discount=0.90, exploration_rate=0.10, learning_rate=0.10, episodes=200,
                              stop_at_convergence=True)
 
+# train using tabular Q-learning, and replay remembered moves after every step (Dyna-Q)
+if test == Test.DYNA_Q:
+    game.render(Render.TRAINING)
+    model = models.DynaQModel(game)
+    h, w, _, _ = model.train(discount=0.90, exploration_rate=0.10, learning_rate=0.10, planning_steps=10, episodes=200,
+                             stop_at_convergence=True)
+
+# train using tabular Q-learning, and sweep the largest value changes backwards after every step
+if test == Test.PRIORITIZED_SWEEPING:
+    game.render(Render.TRAINING)
+    model = models.PrioritizedSweepingModel(game)
+    h, w, _, _ = model.train(discount=0.90, exploration_rate=0.10, learning_rate=0.10, planning_steps=10, episodes=200,
+                             stop_at_convergence=True)
+
 # train using tabular SARSA learning
 if test == Test.SARSA:
     game.render(Render.TRAINING)
@@ -115,6 +134,12 @@ if test == Test.SARSA_ELIGIBILITY:
     h, w, _, _ = model.train(discount=0.90, exploration_rate=0.10, learning_rate=0.10, episodes=200,
                              stop_at_convergence=True)
 
+# plan using value iteration on the known transitions and rewards of the maze, no training games needed
+if test == Test.VALUE_ITERATION:
+    game.render(Render.TRAINING)
+    model = models.ValueIterationModel(game)
+    _, _, sweeps, seconds = model.train(discount=0.90, stop_at_convergence=True)
+
 # train using a neural network with experience replay (also saves the resulting model)
 if test == Test.DEEP_Q:
     game.render(Render.TRAINING)
@@ -142,13 +167,31 @@ except NameError:
 if test == Test.LOAD_DEEP_Q:
     model = models.QReplayNetworkModel(game, load=True)
 
+# compare the number of episodes the deep Q network needs to converge with uniform and prioritized replay
+if test == Test.PRIORITIZED_REPLAY:
+    runs = 3
+
+    for replay in ("uniform", "prioritized"):
+        episodes = list()
+
+        logging.disable(logging.WARNING)
+        for r in range(runs):
+            model = models.QReplayNetworkModel(game)
+            _, _, e, _ = model.train(discount=0.80, exploration_rate=0.10, episodes=maze.size * 10,
+                                     max_memory=maze.size * 4, replay=replay, stop_at_convergence=True)
+            episodes.append(e)
+
+        logging.disable(logging.NOTSET)
+        logging.info("replay: {} | trained {} times | average no of episodes: {}"
+                     .format(replay, runs, np.average(episodes)))
+
 # compare learning speed (cumulative rewards and win rate) of several models in a diagram
 if test == Test.SPEED_TEST_1:
     rhist = list()
     whist = list()
     names = list()
 
-    models_to_run = [0, 1, 2, 3, 4]
+    models_to_run = [0, 1, 2, 3, 4, 5]
 
     for model_id in models_to_run:
         logging.disable(logging.WARNING)
@@ -162,6 +205,8 @@ if test == Test.SPEED_TEST_1:
             model = models.SarsaTableTraceModel(game)
         elif model_id == 4:
             model = models.QReplayNetworkModel(game)
+        elif model_id == 5:
+            model = models.PrioritizedSweepingModel(game)
 
         r, w, _, _ = model.train(discount=0.90, exploration_rate=0.10, exploration_decay=0.999, learning_rate=0.10,
                                  episodes=300)
@@ -191,7 +236,7 @@ if test == Test.SPEED_TEST_2:
     nme = list()
     sec = list()
 
-    models_to_run = [0, 1, 2, 3, 4]
+    models_to_run = [0, 1, 2, 3, 4, 5]
 
     for model_id in models_to_run:
         episodes = list()
@@ -209,6 +254,8 @@ if test == Test.SPEED_TEST_2:
                 model = models.SarsaTableTraceModel(game)
             elif model_id == 4:
                 model = models.QReplayNetworkModel(game)
+            elif model_id == 5:
+                model = models.PrioritizedSweepingModel(game)
 
             _, _, e, s = model.train(stop_at_convergence=True, discount=0.90, exploration_rate=0.10,
                                      exploration_decay=0.999, learning_rate=0.10, episodes=1000)
@@ -239,6 +286,49 @@ if test == Test.SPEED_TEST_2:
 
     plt.show()
 
+# compare the number of steps per second of a headless maze and a maze with a renderer attached
+if test == Test.RENDER_SPEED_TEST:
+    for content, steps in ((Render.NOTHING, 100000), (Render.MOVES, 100)):
+        game.render(content)
+        game.reset()
+
+        start_time = time.perf_counter()
+        for _ in range(steps):
+            _, _, status = game.step(random.choice(game.actions))
+            if status in (Status.WIN, Status.LOSE):
+                game.reset()
+        seconds = time.perf_counter() - start_time
+
+        logging.info("render: {} | steps: {} | steps per second: {:.0f}".format(content.name, steps, steps / seconds))
+
+    game.render(Render.NOTHING)
+    model = models.RandomModel(game)
+
+# check that creating and resetting a maze scales to a million cells (creation linear, reset constant time)
+if test == Test.SCALE_TEST:
+    for size in (100, 1000, 2000):
+        big_maze = (np.random.random((size, size)) < 0.25).astype(int)
+        big_maze[0, 0] = big_maze[-1, -1] = 0
+
+        start_time = time.perf_counter()
+        big_game = Maze(big_maze)
+        seconds = time.perf_counter() - start_time
+
+        start_cells = np.random.choice(big_game.empty, 10000).tolist()
+        start_time = time.perf_counter()
+        for cell in start_cells:
+            big_game.reset(cell)
+        reset_seconds = (time.perf_counter() - start_time) / len(start_cells)
+
+        logging.info("cells: {} | create: {:.3f} s | reset: {:.2f} us"
+                     .format(big_maze.size, seconds, reset_seconds * 1e6))
+
+    start_time = time.perf_counter()
+    mazes, exits = generate_batch(10000, 101, 101, algorithm="binary_tree")
+    logging.info("generated {} mazes of 101 x 101 | {:.1f} s".format(len(mazes), time.perf_counter() - start_time))
+
+    model = models.RandomModel(game)
+
 game.render(Render.MOVES)
 game.play(model, start_cell=(4, 1))
 
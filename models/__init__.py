@@ -1,7 +1,13 @@
 from .abstractmodel import *
+from .cache import *
+from .dynaq import *
+from .oracle import *
+from .prioritized_sweeping import *
 from .qrandom import *
 from .qreplaynetwork import *
 from .qtable import *
 from .qtable_trace import *
 from .sarsa import *
 from .sarsa_trace import *
+from .table import *
+from .value_iteration import *
@@ -2,11 +2,16 @@
 """
 from abc import ABC, abstractmethod
 
+import numpy as np
+
 
 class AbstractModel(ABC):
+    greedy = False  # True if predict() always takes an action with the highest q value, see Maze.check_win_all()
+
     def __init__(self, maze, **kwargs):
         self.environment = maze
         self.name = kwargs.get("name", "model")
+        self.q_version = 0  # increased when q values change without being passed to check_win_all() as 'changed'
 
     def load(self, filename):
         """ Load model from file. """
@@ -29,3 +34,24 @@ class AbstractModel(ABC):
     def predict(self, state):
         """ Predict value based on state. """
         pass
+
+    def q_grid(self):
+        """ Return q values for all cells, indexed by cell index (row * ncols + col) and action. """
+        nrows, ncols = self.environment.maze.shape
+        grid = np.zeros((nrows * ncols, len(self.environment.actions)))
+        for cell in self.environment.empty.tolist():
+            row, col = divmod(cell, ncols)
+            grid[cell] = self.q((col, row))
+        return grid
+
+    def set_q_grid(self, grid):
+        """ Replace the q values by 'grid' (as returned by q_grid()), for example from a cache.
+
+            Only models whose q values are a table override this, see restorable().
+        """
+        raise NotImplementedError("{} cannot be restored from a q value grid".format(self.name))
+
+    @classmethod
+    def restorable(cls):
+        """ Return True if the model can be restored from a q value grid by set_q_grid(). """
+        return cls.set_q_grid is not AbstractModel.set_q_grid
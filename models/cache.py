@@ -0,0 +1,145 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+import numpy as np
+
+from environment.maze import Cell
+
+
+class PolicyCache:
+    """ On-disk cache of trained q-values, so a model for a maze it has seen before does not need training again.
+
+        Entries are addressed by a hash of everything which determines the outcome of training: the maze layout,
+        the exit cell, the rewards, the model class and its hyperparameters. An entry holds the q-values of the
+        empty cells as a float32 .npy file.
+
+        The total size of the cache is bounded. When it grows too large the least recently used entries (oldest
+        modification time, which is refreshed on every hit) are removed. Entries are written to a temporary file
+        and then renamed, so several processes can safely share a cache directory. By default the cache lives in
+        the user's cache directory ($XDG_CACHE_HOME or ~/.cache), not in the current working directory.
+
+        Only models which can be restored from a q-value grid (see AbstractModel.restorable()) can be cached.
+    """
+
+    def __init__(self, directory=None, max_bytes=64 * 1024 ** 2):
+        """ Create a new cache.
+
+            :param str directory: directory where the entries are stored, created if it does not exist (optional,
+                                  else maze_policy_cache in the user's cache directory)
+            :param int max_bytes: maximum total size of all entries
+        """
+        if directory is None:
+            base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+            directory = os.path.join(base, "maze_policy_cache")
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, model, **kwargs):
+        """ Return the key of the cache entry for 'model' trained with hyperparameters 'kwargs'.
+
+            :param class AbstractModel model: prediction model, its class and environment are part of the key
+            :param kwargs: training parameters as passed to model.train()
+            :return str: hexadecimal hash
+        """
+        game = model.environment
+        h = hashlib.sha256()
+        h.update(np.ascontiguousarray(game.maze != Cell.EMPTY).tobytes())
+        h.update(json.dumps({
+            "shape": game.maze.shape,
+            "exit": game.exit_index,
+            "rewards": [game.reward_exit, game.penalty_move, game.penalty_visited, game.penalty_impossible_move],
+            "model": "{}.{}".format(type(model).__module__, type(model).__qualname__),
+            "kwargs": kwargs
+        }, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    def get(self, key, game):
+        """ Return the q-value grid stored under 'key', or None if there is no such entry.
+
+            :param str key: key as returned by key()
+            :param class Maze game: maze the entry belongs to
+            :return np.ndarray: q-values indexed by cell index and action
+        """
+        try:
+            stored = np.load(self.__path(key))
+            os.utime(self.__path(key))  # mark as recently used
+        except (OSError, ValueError):
+            return None
+
+        grid = np.zeros((game.maze.size, len(game.actions)))
+        grid[np.flatnonzero(game.maze == Cell.EMPTY)] = stored
+        return grid
+
+    def put(self, key, game, grid):
+        """ Store q-value grid 'grid' under 'key', and evict the least recently used entries if needed.
+
+            :param str key: key as returned by key()
+            :param class Maze game: maze the grid belongs to
+            :param np.ndarray grid: q-values indexed by cell index and action
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False) as file:
+            np.save(file, grid[np.flatnonzero(game.maze == Cell.EMPTY)].astype(np.float32))
+        os.replace(file.name, self.__path(key))
+
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """ Remove the least recently used entries until the total size is at most max_bytes.
+
+            The entry 'keep' counts towards the total but is never removed, so if it alone is larger than
+            max_bytes all other entries are removed and the cache stays larger than max_bytes.
+
+            :param str keep: key of an entry which is never removed, for example the one just stored (optional)
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npy"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # removed by another process
+                    continue
+                total += stat.st_size
+                if entry.name != "{}.npy".format(keep):
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def load_or_train(self, model, stop_at_convergence=False, **kwargs):
+        """ Restore the q-values of 'model' from the cache, or train it and store the result.
+
+            :param class AbstractModel model: untrained prediction model
+            :param stop_at_convergence: stop training as soon as convergence is reached
+            :param kwargs: hyperparameters, as for model.train()
+            :return bool: True if the model was restored from the cache, False if it was trained
+        """
+        if not model.restorable():
+            raise ValueError("{} cannot be restored from a q value grid and cannot be cached".format(model.name))
+
+        key = self.key(model, stop_at_convergence=stop_at_convergence, **kwargs)
+
+        grid = self.get(key, model.environment)
+        if grid is not None:
+            model.set_q_grid(grid)
+            logging.info("{}: restored from cache entry {}".format(model.name, key[:12]))
+            return True
+
+        model.train(stop_at_convergence=stop_at_convergence, **kwargs)
+        self.put(key, model.environment, model.q_grid())
+        return False
+
+    def __path(self, key):
+        return os.path.join(self.directory, key + ".npy")
@@ -0,0 +1,130 @@
+import logging
+import random
+import time
+from datetime import timedelta
+
+from models.engine import TabularModel, QLearning
+
+
+class TrainingTime(timedelta):
+    """ Total time spent on training, split in time spent on real steps (acting) and on replaying remembered
+        transitions (planning).
+
+        Behaves as a timedelta of the total time, as returned by the train() method of the other models.
+    """
+    planning = timedelta(0)  # time spent on replaying remembered transitions
+
+    @classmethod
+    def split(cls, total, planning):
+        """ Create a new training time.
+
+            :param timedelta total: total time spent
+            :param float planning: seconds of the total spent on planning
+            :return TrainingTime: total time, split in acting and planning
+        """
+        spent = cls(total.days, total.seconds, total.microseconds)
+        spent.planning = timedelta(seconds=planning)
+        return spent
+
+    @property
+    def acting(self):
+        """ Time spent on real steps. """
+        return timedelta(self.days, self.seconds, self.microseconds) - self.planning
+
+    def __reduce__(self):
+        return self.__class__.split, (timedelta(self.days, self.seconds, self.microseconds),
+                                      self.planning.total_seconds())
+
+
+class DynaQ(QLearning):
+    """ Q-learning update followed by replaying randomly chosen remembered transitions (planning). """
+    supports_lockstep = False  # the batch update of QLearning would skip the planning steps
+
+    def __init__(self, Q, memory, discount=0.90, learning_rate=0.10, planning_steps=10):
+        """ Create a new update rule.
+
+            :param dict memory: last observed (reward, next_state) per (state, action) combination, updated here
+            :param int planning_steps: number of remembered transitions to replay after every real step
+        """
+        super().__init__(Q, discount, learning_rate)
+        self.memory = memory
+        self.observed = list(memory)  # (state, action) combinations in memory, for sampling
+        self.planning_steps = planning_steps
+        self.planning_time = 0.0  # seconds spent on replaying remembered transitions
+
+    def update(self, state, action, reward, next_state, next_action, changed):
+        super().update(state, action, reward, next_state, next_action, changed)
+
+        if (state, action) not in self.memory:
+            self.observed.append((state, action))
+        self.memory[(state, action)] = (reward, next_state)
+
+        t = time.perf_counter()
+
+        # planning: replay randomly chosen remembered transitions
+        observed, memory = self.observed, self.memory
+        for _ in range(self.planning_steps):
+            s, a = observed[random.randrange(len(observed))]
+            r, n = memory[(s, a)]
+            super().update(s, a, r, n, None, changed)
+            changed.add(s)
+
+        self.planning_time += time.perf_counter() - t
+
+    def update_batch(self, states, actions, rewards, next_states, next_actions):
+        """ Not supported, the Q-learning batch update inherited from QLearning would skip the planning steps. """
+        raise NotImplementedError("{} does not support lockstep training".format(type(self).__name__))
+
+
+class DynaQModel(TabularModel):
+    """ Tabular Dyna-Q prediction model.
+
+        Works like QTableModel, but also remembers what happened after each (state, action) combination it tried:
+        the reward and the next state. After every real step in the maze it replays a number of these remembered
+        transitions (planning steps) and updates the table as if they happened again. As the maze is deterministic
+        the remembered transitions are exact, apart from the penalty for revisiting a cell which depends on the path
+        taken; the last observed reward is used.
+
+        Planning steps are much cheaper than real steps, and spread the reward found at the exit backwards without
+        having to walk there again, so far fewer training games are needed.
+    """
+
+    def __init__(self, game, **kwargs):
+        """ Create a new prediction model for 'game'.
+
+        :param class Maze game: Maze game object
+        :param kwargs: model dependent init parameters
+        """
+        super().__init__(game, name="DynaQModel", **kwargs)
+        self.memory = dict()  # last observed (reward, next_state) per (state, action) combination
+        self.__rule = None
+
+    def rule(self, **kwargs):
+        """ Return the update rule to train with, see TabularModel.train() for the other hyperparameters.
+
+            Hyperparameters:
+            :keyword float discount: (gamma) preference for future rewards (0 = not at all, 1 = only)
+            :keyword float learning_rate: (alpha) preference for using new knowledge (0 = not at all, 1 = only)
+            :keyword int planning_steps: number of remembered transitions to replay after every real step
+            :return DynaQ: update rule for self.Q
+        """
+        self.__rule = DynaQ(self.Q, self.memory, kwargs.get("discount", 0.90), kwargs.get("learning_rate", 0.10),
+                            kwargs.get("planning_steps", 10))
+        return self.__rule
+
+    def train(self, stop_at_convergence=False, **kwargs):
+        """ Train the model, see TabularModel.train().
+
+            :return int, TrainingTime: number of training episodes, total time spent split in acting and planning
+                                       (a plain timedelta when training in worker processes, which do not report
+                                       the split)
+        """
+        self.__rule = None
+
+        cumulative_reward_history, win_history, episode, spent = super().train(stop_at_convergence, **kwargs)
+
+        if self.__rule is not None:  # not when training in worker processes
+            spent = TrainingTime.split(spent, self.__rule.planning_time)
+            logging.info("acting: {} | planning: {}".format(spent.acting, spent.planning))
+
+        return cumulative_reward_history, win_history, episode, spent
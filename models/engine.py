@@ -0,0 +1,536 @@
+""" Training engine shared by the tabular models.
+
+    All tabular models play training games the same way: start from every empty cell in turn (in random order),
+    choose actions epsilon greedy, and check for convergence after every few games. They only differ in how the
+    table is updated after a step, which is delegated to an update rule:
+
+        QLearning       Q[s, a] += alpha * (r + gamma * max(Q[s']) - Q[s, a])
+        Sarsa           Q[s, a] += alpha * (r + gamma * Q[s', a'] - Q[s, a]), a' is the action taken next
+        QLearningTrace  the Q-learning error applied to all (state, action) combinations in an eligibility trace
+        SarsaTrace      the SARSA error applied to all (state, action) combinations in an eligibility trace
+
+    A tabular model is a TabularModel which returns its update rule from rule().
+
+    With train(agents=B) the engine plays B games at once in lockstep on a VectorMaze instead, choosing the actions
+    of all agents with one argmax over the table and updating it once per step for all of them. Only QLearning and
+    Sarsa support this.
+
+    With train(workers=W) the engine plays games in W worker processes at the same time (Hogwild). The q values are
+    kept in shared memory, and every worker updates them without any locking while playing games from its own
+    share of the start cells. Updates of different workers may occasionally overwrite each other, which hardly
+    matters as the updates are small and mostly touch different cells. The coordinating process checks for
+    convergence after every round of check_convergence_every games per worker.
+"""
+import logging
+import multiprocessing
+import random
+from abc import ABC, abstractmethod
+from datetime import datetime
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from environment import Maze, Status, VectorMaze
+from .abstractmodel import AbstractModel
+from .table import QTable
+from .trace import EligibilityTrace
+
+__all__ = ["TabularModel", "UpdateRule", "QLearning", "Sarsa", "QLearningTrace", "SarsaTrace"]
+
+
+class UpdateRule(ABC):
+    """ Update of a q value table after a step in the maze.
+
+        On-policy rules (on_policy = True) learn from the action which will be taken next. For these the engine
+        chooses the next action before the update, and then takes it. Rules which implement update_batch() set
+        supports_lockstep = True, only these can train several agents in lockstep.
+    """
+    on_policy = False
+    supports_lockstep = False
+
+    def __init__(self, Q, discount=0.90, learning_rate=0.10):
+        """ Create a new update rule.
+
+            :param QTable Q: table to update
+            :param float discount: (gamma) preference for future rewards (0 = not at all, 1 = only)
+            :param float learning_rate: (alpha) preference for using new knowledge (0 = not at all, 1 = only)
+        """
+        self.Q = Q
+        self.discount = discount
+        self.learning_rate = learning_rate
+
+    def start(self):
+        """ Called at the start of every training game. """
+        pass
+
+    @abstractmethod
+    def update(self, state, action, reward, next_state, next_action, changed):
+        """ Update the table after taking 'action' in 'state'.
+
+            :param int state: cell index the action was taken in
+            :param int action: action taken
+            :param float reward: reward received
+            :param int next_state: cell index after the action
+            :param int next_action: action which will be taken next (on-policy rules only, else None)
+            :param set changed: add the cell index of any other cell whose q values are updated here
+        """
+        pass
+
+    def update_batch(self, states, actions, rewards, next_states, next_actions):
+        """ Update the table after a lockstep step of several agents, see update(), but with an array per argument.
+        """
+        raise NotImplementedError("{} does not support lockstep training".format(type(self).__name__))
+
+    def apply(self, states, actions, delta):
+        """ Add learning_rate * delta to the q value of every (state, action).
+
+            Agents which took the same action in the same state are combined by averaging their errors, so the
+            outcome does not depend on the order of the agents and many agents in one cell do not overshoot.
+        """
+        grid = self.Q.grid()
+        key = states * grid.shape[1] + actions
+        key, inverse, counts = np.unique(key, return_inverse=True, return_counts=True)
+        grid.reshape(-1)[key] += self.learning_rate * np.bincount(inverse, weights=delta) / counts
+
+
+class QLearning(UpdateRule):
+    """ Off-policy update towards the best action in the next state. """
+    supports_lockstep = True
+
+    def update(self, state, action, reward, next_state, next_action, changed):
+        Q = self.Q
+        Q[state, action] += self.learning_rate * (reward + self.discount * Q.max(next_state) - Q[state, action])
+
+    def update_batch(self, states, actions, rewards, next_states, next_actions):
+        grid = self.Q.grid()
+        self.apply(states, actions, rewards + self.discount * grid[next_states].max(axis=1) - grid[states, actions])
+
+
+class Sarsa(UpdateRule):
+    """ On-policy update towards the action which will be taken in the next state. """
+    on_policy = True
+    supports_lockstep = True
+
+    def update(self, state, action, reward, next_state, next_action, changed):
+        Q = self.Q
+        next_Q = Q[next_state, next_action]
+        Q[state, action] += self.learning_rate * (reward + self.discount * next_Q - Q[state, action])
+
+    def update_batch(self, states, actions, rewards, next_states, next_actions):
+        grid = self.Q.grid()
+        self.apply(states, actions, rewards + self.discount * grid[next_states, next_actions] - grid[states, actions])
+
+
+class QLearningTrace(UpdateRule):
+    """ Q-learning which also updates the (state, action) combinations visited before, by their eligibility. """
+
+    def __init__(self, Q, discount=0.90, learning_rate=0.10, eligibility_decay=0.80, trace="accumulating",
+                 trace_threshold=1e-4):
+        """ Create a new update rule.
+
+            :param float eligibility_decay: (lambda) eligibility trace decay rate per step (0 = no trace, 1 = no decay)
+            :param str trace: accumulating, replacing or dutch, see EligibilityTrace
+            :param float trace_threshold: drop (state, action) combinations with a trace below this (0 = never)
+        """
+        super().__init__(Q, discount, learning_rate)
+        self.decay = discount * eligibility_decay
+        self.trace = EligibilityTrace(trace, trace_threshold, learning_rate)
+
+    def start(self):
+        self.trace.clear()
+
+    def target(self, next_state, next_action):
+        """ Value of the next state the error is computed against. """
+        return self.Q.max(next_state)
+
+    def update(self, state, action, reward, next_state, next_action, changed):
+        self.trace.visit(state, action)
+
+        delta = reward + self.discount * self.target(next_state, next_action) - self.Q[state, action]
+
+        self.trace.update(self.Q, self.learning_rate * delta)
+        self.trace.decay(self.decay)
+
+
+class SarsaTrace(QLearningTrace):
+    """ SARSA which also updates the (state, action) combinations visited before, by their eligibility. """
+    on_policy = True
+
+    def target(self, next_state, next_action):
+        return self.Q[next_state, next_action]
+
+
+class TabularModel(AbstractModel):
+    """ Base class for the tabular models, holds the q value table and plays the training games.
+
+        Subclasses only define their update rule, see rule().
+    """
+    default_check_convergence_every = 1  # by default check for convergence after every episode
+    greedy = True
+
+    def __init__(self, game, **kwargs):
+        """ Create a new prediction model for 'game'.
+
+        :param class Maze game: Maze game object
+        :param kwargs: model dependent init parameters
+        """
+        super().__init__(game, **kwargs)
+        self.Q = QTable(game)  # table with value per (state, action) combination
+
+    @abstractmethod
+    def rule(self, **kwargs):
+        """ Return the update rule to train with.
+
+            :param kwargs: hyperparameters as passed to train()
+            :return UpdateRule: update rule for self.Q
+        """
+        pass
+
+    def train(self, stop_at_convergence=False, **kwargs):
+        """ Train the model.
+
+            :param stop_at_convergence: stop training as soon as convergence is reached
+
+            Hyperparameters (the update rule can use more, see rule()):
+            :keyword float exploration_rate: (epsilon) 0 = preference for exploring (0 = not at all, 1 = only)
+            :keyword float exploration_decay: exploration rate reduction after each random step (<= 1, 1 = no at all)
+            :keyword int episodes: number of training games to play
+            :keyword int agents: number of games to play simultaneously in lockstep (default 1, one game at a time)
+            :keyword int seed: seed for lockstep training (optional, else unpredictable)
+            :keyword int workers: number of processes to play games in parallel (default 1, this process only)
+            :keyword list start_cells: cell indices to start training games from (optional, else all empty cells)
+            :return int, datetime: number of training episodes, total time spent
+        """
+        exploration_rate = kwargs.get("exploration_rate", 0.10)
+        exploration_decay = kwargs.get("exploration_decay", 0.995)  # % reduction per step = 100 - exploration decay
+        episodes = max(kwargs.get("episodes", 1000), 1)
+        check_convergence_every = kwargs.get("check_convergence_every", self.default_check_convergence_every)
+
+        # the cells changed since the last check of a previous training are not known, so the first check is a full one
+        self.q_version += 1
+
+        if kwargs.get("workers", 1) > 1:
+            return self.__train_parallel(stop_at_convergence, exploration_rate, exploration_decay, episodes,
+                                         check_convergence_every, kwargs)
+
+        rule = self.rule(**kwargs)
+
+        if kwargs.get("agents", 1) > 1:
+            if not rule.supports_lockstep:
+                raise ValueError("{} does not support lockstep training (agents > 1)".format(type(rule).__name__))
+            return self.__train_lockstep(rule, stop_at_convergence, exploration_rate, exploration_decay, episodes,
+                                         check_convergence_every, kwargs["agents"], kwargs.get("seed"))
+
+        # variables for reporting purposes
+        cumulative_reward = 0
+        cumulative_reward_history = []
+        win_history = []
+
+        start_list = list()
+        changed = set()  # cells with updated q values since the last convergence check
+        start_time = datetime.now()
+
+        # optimization: look up everything used in the loop below only once
+        environment = self.environment
+        start_cells = np.asarray(kwargs.get("start_cells", environment.empty))
+        actions = environment.actions
+        step, index, greedy, update = environment.step, environment.index, self.__greedy, rule.update
+        on_policy = rule.on_policy
+        next_action = None
+
+        environment.render_q(self)  # when rendering, the best actions are redrawn after every step
+
+        # training starts here
+        for episode in range(1, episodes + 1):
+            # optimization: make sure to start from all possible cells
+            if not start_list:
+                start_list = start_cells.tolist()
+                random.shuffle(start_list)
+            start_cell = start_list.pop()
+
+            state = index(environment.reset(start_cell))  # use the cell index as table key
+
+            rule.start()
+
+            if on_policy:
+                action = random.choice(actions) if np.random.random() < exploration_rate else greedy(state)
+
+            while True:
+                if not on_policy:
+                    # choose action epsilon greedy (off-policy, instead of only using the learned policy)
+                    action = random.choice(actions) if np.random.random() < exploration_rate else greedy(state)
+
+                next_state, reward, status = step(action)
+                next_state = index(next_state)
+                if on_policy:
+                    next_action = greedy(next_state)  # use the model to get the next action
+
+                cumulative_reward += reward
+
+                update(state, action, reward, next_state, next_action, changed)
+                changed.add(state)
+
+                if status in (Status.WIN, Status.LOSE):  # terminal state reached, stop training episode
+                    break
+
+                state = next_state
+                action = next_action  # on-policy: always follow the predicted action
+
+            cumulative_reward_history.append(cumulative_reward)
+
+            logging.info("episode: {:d}/{:d} | status: {:4s} | e: {:.5f}"
+                         .format(episode, episodes, status.name, exploration_rate))
+
+            if episode % check_convergence_every == 0:
+                # check if the current model does win from all starting cells
+                # only possible if there is a finite number of starting states
+                w_all, win_rate = environment.check_win_all(self, changed)
+                changed.clear()
+                win_history.append((episode, win_rate))
+                if w_all is True and stop_at_convergence is True:
+                    logging.info("won from all start cells, stop learning")
+                    break
+
+            exploration_rate *= exploration_decay  # explore less as training progresses
+
+        logging.info("episodes: {:d} | time spent: {}".format(episode, datetime.now() - start_time))
+
+        return cumulative_reward_history, win_history, episode, datetime.now() - start_time
+
+    def __train_lockstep(self, rule, stop_at_convergence, exploration_rate, exploration_decay, episodes,
+                         check_convergence_every, agents, seed):
+        """ Train by playing 'agents' games at once, see train().
+
+            A game counts as an episode when it ends. Exploration decays per finished game, and convergence is
+            checked after the step in which the number of finished games reaches the next multiple of
+            check_convergence_every.
+        """
+        environment = self.environment
+        grid = self.Q.grid()
+        nactions = len(environment.actions)
+
+        vector_seed, seed = np.random.SeedSequence(seed).spawn(2)
+        vector = VectorMaze(environment, agents, vector_seed)
+        rng = np.random.default_rng(seed)
+
+        def greedy(states):
+            """ Best action per state, random choice if multiple actions have the same (max) value. """
+            q = grid[states]
+            return np.argmax((q == q.max(axis=1, keepdims=True)) * rng.random(q.shape), axis=1)
+
+        def choose(states):
+            """ Epsilon greedy action per state. """
+            actions = greedy(states)
+            explore = np.flatnonzero(rng.random(len(states)) < exploration_rate)
+            actions[explore] = rng.integers(nactions, size=explore.size)
+            return actions
+
+        # variables for reporting purposes
+        cumulative_reward = 0
+        cumulative_reward_history = []
+        win_history = []
+
+        episode = 0
+        next_check = check_convergence_every
+        changed = np.zeros(environment.maze.size, dtype=bool)  # cells with updated q values since the last check
+        start_time = datetime.now()
+
+        environment.render_q(self)
+
+        # spread the agents over all possible start cells
+        states = vector.reset(np.resize(rng.permutation(environment.empty), agents))
+        actions = choose(states)
+
+        while episode < episodes:
+            next_states, rewards, status = vector.step(actions)  # finished games are restarted in next_states
+            reached = vector.terminal_state
+            next_actions = None
+            if rule.on_policy:
+                next_actions = greedy(reached)
+
+            rule.update_batch(states, actions, rewards, reached, next_actions)
+            changed[states] = True
+
+            cumulative_reward += rewards.sum()
+
+            done = np.flatnonzero(status != Status.PLAYING.value)
+            if done.size:
+                finished = min(done.size, episodes - episode)
+                episode += finished
+                cumulative_reward_history.extend([cumulative_reward] * finished)
+                exploration_rate *= exploration_decay ** finished  # explore less as training progresses
+
+                if episode >= next_check or episode == episodes:
+                    next_check = (episode // check_convergence_every + 1) * check_convergence_every
+
+                    w_all, win_rate = environment.check_win_all(self, set(np.flatnonzero(changed).tolist()))
+                    changed[:] = False
+                    win_history.append((episode, win_rate))
+
+                    logging.info("episode: {:d}/{:d} | win rate: {:.3f} | e: {:.5f}"
+                                 .format(episode, episodes, win_rate, exploration_rate))
+
+                    environment.render_q(self)  # the agents do not step the maze itself, so redraw here
+
+                    if w_all is True and stop_at_convergence is True:
+                        logging.info("won from all start cells, stop learning")
+                        break
+
+            states = next_states
+            if rule.on_policy:
+                actions = next_actions  # on-policy: always follow the predicted action, except in a new game
+                actions[done] = choose(states[done])
+            else:
+                actions = choose(states)
+
+        logging.info("episodes: {:d} | agents: {:d} | time spent: {}"
+                     .format(episode, agents, datetime.now() - start_time))
+
+        return cumulative_reward_history, win_history, episode, datetime.now() - start_time
+
+    def __train_parallel(self, stop_at_convergence, exploration_rate, exploration_decay, episodes,
+                         check_convergence_every, kwargs):
+        """ Train by playing games in several worker processes which share the q values, see train().
+
+            Every round each worker plays check_convergence_every games (a model.train() of its own, on its own
+            copy of the maze), after which the coordinator checks for convergence. In the last round the remaining
+            games are divided over the workers, so exactly 'episodes' games are played unless training stops at
+            convergence. Exploration decays per game played by a worker.
+        """
+        environment = self.environment
+        workers = kwargs["workers"]
+
+        memory = shared_memory.SharedMemory(create=True, size=self.Q.values.nbytes)
+        private, self.Q = self.Q, QTable(environment, memory.buf)  # check_win_all() reads the shared q values
+        self.Q.values[:] = private.values
+
+        exit_cell = divmod(environment.exit_index, environment.maze.shape[1])[::-1]
+        start_cells = np.random.permutation(np.asarray(kwargs.get("start_cells", environment.empty)))
+        worker_kwargs = {key: value for key, value in kwargs.items() if key not in ("workers", "start_cells")}
+
+        pool = multiprocessing.Pool(workers, initializer=_attach_worker,
+                                    initargs=(type(self), environment.maze, exit_cell, environment.compact,
+                                              memory.name, start_cells, worker_kwargs))
+
+        # variables for reporting purposes
+        cumulative_reward = 0
+        cumulative_reward_history = []
+        win_history = []
+
+        episode = 0
+        start_time = datetime.now()
+
+        environment.render_q(self)
+
+        try:
+            while episode < episodes:
+                total = min(check_convergence_every * workers, episodes - episode)
+                games = [total // workers + (shard < total % workers) for shard in range(workers)]
+                histories = pool.starmap(_play, [(shard, workers, n, exploration_rate)
+                                                 for shard, n in enumerate(games) if n > 0])
+
+                for history in histories:
+                    cumulative_reward_history.extend((cumulative_reward + np.asarray(history)).tolist())
+                    cumulative_reward += history[-1]
+
+                episode += total
+                exploration_rate *= exploration_decay ** games[0]  # explore less as training progresses
+
+                w_all, win_rate = environment.check_win_all(self)
+                win_history.append((episode, win_rate))
+
+                logging.info("episode: {:d}/{:d} | win rate: {:.3f} | e: {:.5f}"
+                             .format(episode, episodes, win_rate, exploration_rate))
+
+                environment.render_q(self)  # the workers play on their own mazes, so redraw here
+
+                if w_all is True and stop_at_convergence is True:
+                    logging.info("won from all start cells, stop learning")
+                    break
+        finally:
+            pool.terminate()
+            pool.join()
+            private.values[:] = self.Q.values
+            self.Q = private
+            memory.close()
+            memory.unlink()
+
+        logging.info("episodes: {:d} | workers: {:d} | time spent: {}"
+                     .format(episode, workers, datetime.now() - start_time))
+
+        return cumulative_reward_history, win_history, episode, datetime.now() - start_time
+
+    def __greedy(self, cell):
+        """ predict() for a cell index. """
+        q = self.Q[cell].copy()  # snapshot, when training with workers others may change the values meanwhile
+        return random.choice(np.nonzero(q == np.max(q))[0])
+
+    def q(self, state):
+        """ Get q values for all actions for a certain state. """
+        return self.Q[self.environment.index(state)]
+
+    def q_grid(self):
+        """ Return q values for all cells, indexed by cell index and action. """
+        return self.Q.grid()
+
+    def set_q_grid(self, grid):
+        """ Replace the q values by 'grid' (as returned by q_grid()), for example from a cache. """
+        self.Q.load(grid)
+        self.q_version += 1
+
+    def predict(self, state):
+        """ Policy: choose the action with the highest value from the Q-table.
+            Random choice if multiple actions have the same (max) value.
+
+            :param np.ndarray state: game state
+            :return int: selected action
+        """
+        q = self.q(state)
+
+        logging.debug("q[] = {}".format(q))
+
+        actions = np.nonzero(q == np.max(q))[0]  # get index of the action(s) with the max value
+        return random.choice(actions)
+
+
+_worker = dict()  # model of a parallel training worker process, set by _attach_worker()
+
+
+def _attach_worker(model, maze, exit_cell, compact, block, start_cells, kwargs):
+    """ Initialize a worker process: create a model on a copy of the maze, with its q values in shared memory.
+
+        :param class model: TabularModel subclass to train
+        :param np.ndarray maze: maze layout, see Maze
+        :param tuple exit_cell: (col, row) of the exit
+        :param bool compact: compact mode of the coordinator's maze
+        :param str block: name of the shared memory block holding the q values
+        :param np.ndarray start_cells: all start cells, shuffled, which are divided over the workers
+        :param dict kwargs: hyperparameters, as for model.train()
+    """
+    # the models use the global random generators, make sure the workers do not all inherit the same state
+    random.seed()
+    np.random.seed()
+
+    game = Maze(maze, exit_cell=exit_cell, compact=compact)
+    memory = shared_memory.SharedMemory(name=block)
+    _worker["memory"] = memory  # keep a reference, else the memory is released
+    _worker["model"] = model(game)
+    _worker["model"].Q = QTable(game, memory.buf)
+    _worker["start_cells"] = start_cells
+    _worker["kwargs"] = kwargs
+
+
+def _play(shard, shards, episodes, exploration_rate):
+    """ Play and learn from 'episodes' training games from the start cells in 'shard'. Runs in a worker process.
+
+        :param int shard: which part of the start cells to use
+        :param int shards: number of parts the start cells are divided in
+        :param int episodes: number of training games to play
+        :param float exploration_rate: exploration rate at the start of the first game
+        :return list: cumulative reward after each game
+    """
+    start_cells = np.array_split(_worker["start_cells"], shards)[shard]
+    kwargs = dict(_worker["kwargs"], episodes=episodes, exploration_rate=exploration_rate,
+                  check_convergence_every=episodes + 1, start_cells=start_cells)
+
+    return _worker["model"].train(stop_at_convergence=False, **kwargs)[0]
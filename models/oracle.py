@@ -0,0 +1,83 @@
+import logging
+import random
+
+import numpy as np
+
+from environment.policy import PolicyGraph
+from models import AbstractModel
+
+
+class OracleModel(AbstractModel):
+    """ Prediction model which always knows the shortest path to the exit, without any training.
+
+        The q value of an action is discount ** (number of moves from the cell the action leads to, to the exit),
+        taken from the distance field of the maze (see Maze.distance_to_exit). So the best action always moves
+        one step closer to the exit. Impossible moves get a q value of -1, moves into a part of the maze from which
+        the exit cannot be reached get 0.
+
+        Besides being an opponent which needs no training, the model is a reference for other models:
+        optimality() compares their greedy paths with the shortest paths, for all start cells at once.
+    """
+    greedy = True
+
+    def __init__(self, game, **kwargs):
+        """ Create a new prediction model for 'game'.
+
+        :param class Maze game: Maze game object
+        :param kwargs: model dependent init parameters
+        :keyword float discount: (gamma) value of a q value one move further away from the exit
+        """
+        super().__init__(game, name="OracleModel", **kwargs)
+
+        discount = kwargs.get("discount", 0.90)
+
+        distance = game.distance_to_exit()
+        next_distance = np.where(game.transitions >= 0, distance[game.transitions], -1)
+
+        self.Q = np.where(next_distance >= 0, discount ** next_distance.clip(0), 0.0)  # value per (cell, action)
+        self.Q[game.transitions < 0] = -1.0
+
+    def q(self, state):
+        """ Get q values for all actions for a certain state. """
+        return self.Q[self.environment.index(state)]
+
+    def q_grid(self):
+        """ Return q values for all cells, indexed by cell index and action. """
+        return self.Q
+
+    def set_q_grid(self, grid):
+        """ Replace the q values by 'grid' (as returned by q_grid()), for example from a cache. """
+        self.Q = np.array(grid, dtype=self.Q.dtype)
+        self.q_version += 1
+
+    def predict(self, state):
+        """ Policy: choose the action which leads closest to the exit.
+            Random choice if multiple actions are equally good.
+
+            :param np.ndarray state: game state
+            :return int: selected action
+        """
+        q = self.q(state)
+
+        logging.debug("q[] = {}".format(q))
+
+        actions = np.nonzero(q == np.max(q))[0]  # get index of the action(s) with the max value
+        return random.choice(actions)
+
+    def optimality(self, model):
+        """ Compare the greedy paths of 'model' with the shortest paths, from all start cells.
+
+            :param class AbstractModel model: the prediction model to compare
+            :return float, float: win rate, average of shortest path length / path length over the won start cells
+        """
+        graph = PolicyGraph(self.environment)
+        graph.update(model.q_grid())
+
+        cells = self.environment.empty
+        lengths = graph.path_lengths()[cells]
+        won = lengths > 0
+
+        shortest = self.environment.distance_to_exit()[cells]
+        ratio = np.mean(shortest[won] / lengths[won]) if np.any(won) else 0.0
+
+        return np.count_nonzero(won) / len(cells), ratio
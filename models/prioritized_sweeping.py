@@ -0,0 +1,98 @@
+import heapq
+
+from models.engine import TabularModel, UpdateRule
+
+
+class PrioritizedSweeping(UpdateRule):
+    """ Remember every transition, and perform the largest pending updates of remembered transitions. """
+
+    def __init__(self, Q, memory, predecessors, discount=0.90, learning_rate=0.10, planning_steps=10,
+                 priority_threshold=1e-4):
+        """ Create a new update rule.
+
+            :param dict memory: last observed (reward, next_state) per (state, action) combination, updated here
+            :param dict predecessors: (state, action) combinations which lead to a cell, per cell, updated here
+            :param int planning_steps: maximum number of queued updates to perform after every real step
+            :param float priority_threshold: (theta) only queue updates which change a value more than this
+        """
+        super().__init__(Q, discount, learning_rate)
+        self.memory = memory
+        self.predecessors = predecessors
+        self.planning_steps = planning_steps
+        self.priority_threshold = priority_threshold
+        self.queue = list()  # heap of (-priority, state, action), largest priority first
+        self.queued = dict()  # priority per (state, action) in the queue, heap entries with another one are stale
+
+    def update(self, state, action, reward, next_state, next_action, changed):
+        if (state, action) not in self.memory:
+            self.predecessors.setdefault(next_state, set()).add((state, action))
+        self.memory[(state, action)] = (reward, next_state)
+
+        self.__enqueue(state, action)
+
+        # planning: perform the largest pending updates, and queue the predecessors of the updated cells
+        queue, queued = self.queue, self.queued
+        updates = 0
+        while queue and updates < self.planning_steps:
+            priority, s, a = heapq.heappop(queue)
+            if queued.get((s, a)) != -priority:
+                continue  # stale, queued again with a higher priority
+            del queued[(s, a)]
+
+            self.Q[s, a] += self.learning_rate * self.__error(s, a)
+            changed.add(s)
+            updates += 1
+
+            for p, pa in self.predecessors.get(s, ()):
+                self.__enqueue(p, pa)
+
+    def __enqueue(self, state, action):
+        """ Queue the update of (state, action) if it is large enough, or raise its priority if already queued. """
+        priority = abs(self.__error(state, action))
+        if priority > max(self.priority_threshold, self.queued.get((state, action), 0.0)):
+            self.queued[(state, action)] = priority
+            heapq.heappush(self.queue, (-priority, state, action))
+
+    def __error(self, state, action):
+        """ Temporal difference error of (state, action) according to the remembered reward and next state. """
+        reward, next_state = self.memory[(state, action)]
+        max_next_Q = self.Q.max(next_state)
+
+        return reward + self.discount * max_next_Q - self.Q[state, action]
+
+
+class PrioritizedSweepingModel(TabularModel):
+    """ Tabular Q-learning prediction model with prioritized sweeping.
+
+        Like DynaQModel the model remembers the reward and next state for every (state, action) combination it
+        tried, and uses them for extra (planning) updates after every real step. Instead of replaying random
+        remembered transitions, it replays the ones whose value would change most, using a priority queue ordered
+        by the size of the update (the temporal difference error). When the value of a cell changes the values of
+        the (state, action) combinations leading into that cell are out of date as well; these predecessors are
+        found in an index per cell and queued too. This way the reward found at the exit is swept backwards along
+        the path to it in a few steps, instead of one cell per training game.
+    """
+
+    def __init__(self, game, **kwargs):
+        """ Create a new prediction model for 'game'.
+
+        :param class Maze game: Maze game object
+        :param kwargs: model dependent init parameters
+        """
+        super().__init__(game, name="PrioritizedSweepingModel", **kwargs)
+        self.memory = dict()  # last observed (reward, next_state) per (state, action) combination
+        self.predecessors = dict()  # (state, action) combinations which lead to a cell, per cell
+
+    def rule(self, **kwargs):
+        """ Return the update rule to train with, see TabularModel.train() for the other hyperparameters.
+
+            Hyperparameters:
+            :keyword float discount: (gamma) preference for future rewards (0 = not at all, 1 = only)
+            :keyword float learning_rate: (alpha) preference for using new knowledge (0 = not at all, 1 = only)
+            :keyword int planning_steps: maximum number of queued updates to perform after every real step
+            :keyword float priority_threshold: (theta) only queue updates which change a value more than this
+            :return PrioritizedSweeping: update rule for self.Q
+        """
+        return PrioritizedSweeping(self.Q, self.memory, self.predecessors, kwargs.get("discount", 0.90),
+                                   kwargs.get("learning_rate", 0.10), kwargs.get("planning_steps", 10),
+                                   kwargs.get("priority_threshold", 1e-4))
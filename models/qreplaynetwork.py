@@ -16,11 +16,16 @@ from keras.models import model_from_json
 
 from environment import Status
 from models import AbstractModel
+from models.sumtree import SumTree
 
 
 class ExperienceReplay:
     """ Store game transitions (from state s to s' via action a) and record the rewards. When
         a sample is requested update the Q's.
+
+        The transitions are kept in a ring buffer: parallel numpy arrays with room for max_memory transitions
+        (states, actions, rewards, next states and statuses), allocated when the first transition arrives. Once
+        full, every new transition overwrites the oldest one.
     """
 
     def __init__(self, model, max_memory=1000, discount=0.95):
@@ -31,17 +36,43 @@ class ExperienceReplay:
         """
         self.model = model
         self.discount = discount
-        self.memory = list()
         self.max_memory = max_memory
+        self.size = 0  # number of transitions stored
+        self.position = 0  # position in the arrays of the next transition, once full the oldest one
+
+        self.states = None
+        self.actions = None
+        self.rewards = None
+        self.next_states = None
+        self.statuses = None  # Status value per transition
+
+    def __len__(self):
+        return self.size
 
     def remember(self, transition):
-        """ Add a game transition at the tail of the memory list.
+        """ Add a game transition to the memory, replacing the oldest one if the memory is full.
 
             :param list transition: [state, move, reward, next_state, status]
         """
-        self.memory.append(transition)
-        if len(self.memory) > self.max_memory:
-            del self.memory[0]  # forget the oldest memories
+        state, move, reward, next_state, status = transition
+
+        if self.states is None:
+            state_size = np.size(state)
+            self.states = np.zeros((self.max_memory, state_size), dtype=np.asarray(state).dtype)
+            self.actions = np.zeros(self.max_memory, dtype=np.int8)
+            self.rewards = np.zeros(self.max_memory, dtype=float)
+            self.next_states = np.zeros((self.max_memory, state_size), dtype=self.states.dtype)
+            self.statuses = np.zeros(self.max_memory, dtype=np.int8)
+
+        i = self.position
+        self.states[i] = np.ravel(state)
+        self.actions[i] = move
+        self.rewards[i] = reward
+        self.next_states[i] = np.ravel(next_state)
+        self.statuses[i] = status.value
+
+        self.position = (i + 1) % self.max_memory
+        self.size = min(self.size + 1, self.max_memory)
 
     def predict(self, state):
         """ Predict the Q vector belonging to this state.
@@ -49,35 +80,119 @@ class ExperienceReplay:
             :param np.array state: game state
             :return np.array: array with Q's per action
         """
-        return self.model.predict(state)[0]  # prediction is a [1][num_actions] array with Q's
+        return np.asarray(self.model.predict_on_batch(state))[0]  # prediction is a [1][num_actions] array with Q's
 
     def get_samples(self, sample_size=10):
         """ Randomly retrieve a number of observed game states and the corresponding Q target vectors.
 
         :param int sample_size: number of states to return
-        :return np.array: input and target vectors
+        :return np.array: input and target vectors, and the sample weights (None, all samples weigh the same)
         """
-        mem_size = len(self.memory)  # how many episodes are currently stored
-        sample_size = min(mem_size, sample_size)  # cannot take more samples than available in memory
-        state_size = self.memory[0][0].size
-        num_actions = self.model.output_shape[-1]  # number of actions in output layer
+        sample_size = min(self.size, sample_size)  # cannot take more samples than available in memory
+
+        sample = np.random.choice(self.size, sample_size, replace=False)
+        states, targets, _ = self.targets(sample)
+
+        return states, targets, None
+
+    def targets(self, sample):
+        """ Return the states and Q target vectors of the transitions in 'sample'.
 
-        states = np.zeros((sample_size, state_size), dtype=int)
-        targets = np.zeros((sample_size, num_actions), dtype=float)
+            The Q's of the states and of the next states of the whole sample are predicted in a single call.
+            predict_on_batch() is used instead of predict(), which sets up a data pipeline and a progress bar on
+            every call; for one small batch that costs far more than the prediction itself.
+
+        :param np.ndarray sample: indices of the transitions
+        :return np.array: input and target vectors, and the temporal difference error of each transition
+        """
+        sample_size = len(sample)
+        states = self.states[sample]
+
+        q = np.asarray(self.model.predict_on_batch(np.concatenate((states, self.next_states[sample]))))
+        targets = np.array(q[:sample_size], dtype=float)
+        max_next_q = np.max(q[sample_size:], axis=1)
+
+        # no future rewards if a terminal state was reached, so no discount needed
+        statuses = self.statuses[sample]
+        terminal = (statuses == Status.WIN.value) | (statuses == Status.LOSE.value)
 
         # update the Q's from the sample
-        for i, idx in enumerate(np.random.choice(range(mem_size), sample_size, replace=False)):
-            state, move, reward, next_state, status = self.memory[idx]
+        rows, actions = np.arange(sample_size), self.actions[sample]
+        future = np.where(terminal, 0.0, self.discount * max_next_q)
+        errors = self.rewards[sample] + future - targets[rows, actions]
+        targets[rows, actions] += errors
+
+        return states, targets, errors
 
-            states[i] = state
-            targets[i] = self.predict(state)
 
-            if status == "win":
-                targets[i, move] = reward  # no discount needed if a terminal state was reached.
-            else:
-                targets[i, move] = reward + self.discount * np.max(self.predict(next_state))
+class PrioritizedExperienceReplay(ExperienceReplay):
+    """ Experience replay which prefers the transitions the network predicts worst (prioritized experience replay).
 
-        return states, targets
+        A transition is sampled with a probability proportional to its priority (|temporal difference error| +
+        epsilon) ^ alpha, where the error is the one found the last time the transition was sampled. New
+        transitions get the highest priority seen so far so they are replayed at least once. The priorities are
+        kept in a SumTree, so sampling and updating them takes O(log n).
+
+        Preferring some transitions biases the training, which is compensated by weighting every sample by its
+        importance sampling weight (n * P(i)) ^ -beta, divided by the largest weight in the sample. Beta should
+        grow to 1 towards the end of training.
+    """
+
+    def __init__(self, model, max_memory=1000, discount=0.95, alpha=0.6, beta=0.4, epsilon=1e-3):
+        """
+        :param model: Keras NN model.
+        :param int max_memory: number of consecutive game transitions to store
+        :param float discount: (gamma) preference for future rewards (0 = not at all, 1 = only)
+        :param float alpha: how much the priorities count (0 = uniform sampling, 1 = proportional to the error)
+        :param float beta: how much the bias is compensated (0 = not at all, 1 = fully)
+        :param float epsilon: added to the errors so no transition gets priority 0, must be > 0
+        """
+        if epsilon <= 0:
+            raise ValueError("epsilon must be > 0, else transitions can get priority 0 and an infinite weight")
+
+        super().__init__(model, max_memory, discount)
+        self.alpha = alpha
+        self.beta = beta
+        self.epsilon = epsilon
+        self.priorities = SumTree(max_memory)
+        self.max_priority = 1.0
+
+    def remember(self, transition):
+        """ Add a game transition to the memory with the highest priority, replacing the oldest one if full.
+
+            :param list transition: [state, move, reward, next_state, status]
+        """
+        self.priorities.update([self.position], self.max_priority)
+        super().remember(transition)
+
+    def get_samples(self, sample_size=10):
+        """ Retrieve a number of observed game states, chosen by priority, and the corresponding Q target vectors.
+
+            Afterwards the priorities of the sampled transitions are updated with their new errors.
+
+        :param int sample_size: number of states to return
+        :return np.array: input and target vectors, and the importance sampling weight of each sample
+        """
+        sample_size = min(self.size, sample_size)  # cannot take more samples than available in memory
+
+        # take one transition from each of sample_size equal parts of the total priority
+        total = self.priorities.total()
+        values = (np.arange(sample_size) + np.random.random(sample_size)) * (total / sample_size)
+        sample = np.minimum(self.priorities.find(values), self.size - 1)  # guard against rounding beyond the last
+
+        # a value on the border between two items may end up in one with priority 0 due to rounding, which would
+        # get an infinite weight; give these the lowest priority an error can give
+        priority = np.maximum(self.priorities.priority(sample), self.epsilon ** self.alpha)
+        weights = (self.size * priority / total) ** -self.beta
+        weights /= weights.max()
+
+        states, targets, errors = self.targets(sample)
+
+        priorities = (np.abs(errors) + self.epsilon) ** self.alpha
+        self.priorities.update(sample, priorities)
+        self.max_priority = max(self.max_priority, priorities.max())
+
+        return states, targets, weights
 
 
 class QReplayNetworkModel(AbstractModel):
@@ -128,6 +243,14 @@ class QReplayNetworkModel(AbstractModel):
             :keyword float exploration_decay: exploration rate reduction after each random step (<= 1, 1 = no at all)
             :keyword int episodes: number of training games to play
             :keyword int sample_size: number of samples to replay for training
+            :keyword str update: fit (default): 4 epochs over the sample in minibatches of 16, or step: a single
+                                 optimizer step on the whole sample, which is much cheaper
+            :keyword int train_every: number of moves between network updates
+            :keyword int gradient_steps: number of network updates, each on a fresh sample, per update moment
+            :keyword int max_memory: number of most recent transitions to keep for replay
+            :keyword str replay: uniform (default) or prioritized, see PrioritizedExperienceReplay
+            :keyword float priority_alpha: (alpha) how much the priorities count in prioritized replay
+            :keyword float priority_beta: (beta) initial bias compensation of prioritized replay, grows to 1
             :return int, datetime: number of training episodes, total time spent
         """
         discount = kwargs.get("discount", 0.90)
@@ -135,9 +258,24 @@ class QReplayNetworkModel(AbstractModel):
         exploration_decay = kwargs.get("exploration_decay", 0.995)  # % reduction per step = 100 - exploration decay
         episodes = max(kwargs.get("episodes", 1000), 1)
         sample_size = kwargs.get("sample_size", 32)
+        update = kwargs.get("update", "fit")
+        train_every = max(kwargs.get("train_every", 1), 1)
+        gradient_steps = kwargs.get("gradient_steps", 1)
+        max_memory = kwargs.get("max_memory", 1000)
+        replay = kwargs.get("replay", "uniform")
+        priority_beta = kwargs.get("priority_beta", 0.4)
         check_convergence_every = kwargs.get("check_convergence_every", self.default_check_convergence_every)
 
-        experience = ExperienceReplay(self.model, discount=discount)
+        if replay == "uniform":
+            experience = ExperienceReplay(self.model, max_memory=max_memory, discount=discount)
+        elif replay == "prioritized":
+            experience = PrioritizedExperienceReplay(self.model, max_memory=max_memory, discount=discount,
+                                                     alpha=kwargs.get("priority_alpha", 0.6), beta=priority_beta)
+        else:
+            raise ValueError("unknown replay {}, use uniform or prioritized".format(replay))
+
+        if update not in ("fit", "step"):
+            raise ValueError("unknown update {}, use fit or step".format(update))
 
         # variables for reporting purposes
         cumulative_reward = 0
@@ -145,19 +283,25 @@ class QReplayNetworkModel(AbstractModel):
         win_history = []
 
         start_list = list()  # starting cells not yet used for training
+        steps = 0  # moves made during training, over all episodes
         start_time = datetime.now()
 
+        self.environment.render_q(self)  # when rendering, the best actions are redrawn after every step
+
         # training starts here
         for episode in range(1, episodes + 1):
             if not start_list:
-                start_list = self.environment.empty.copy()
-            start_cell = random.choice(start_list)
-            start_list.remove(start_cell)
+                start_list = self.environment.empty.tolist()
+                random.shuffle(start_list)
+            start_cell = start_list.pop()
 
             state = self.environment.reset(start_cell)
 
             loss = 0.0
 
+            if replay == "prioritized":
+                experience.beta = priority_beta + (1.0 - priority_beta) * episode / episodes
+
             while True:
                 if np.random.random() < exploration_rate:
                     action = random.choice(self.environment.actions)
@@ -175,19 +319,22 @@ class QReplayNetworkModel(AbstractModel):
                 if status in (Status.WIN, Status.LOSE):  # terminal state reached, stop episode
                     break
 
-                inputs, targets = experience.get_samples(sample_size=sample_size)
+                steps += 1
+                if steps % train_every == 0:
+                    for _ in range(gradient_steps):
+                        inputs, targets, weights = experience.get_samples(sample_size=sample_size)
 
-                self.model.fit(inputs,
-                               targets,
-                               epochs=4,
-                               batch_size=16,
-                               verbose=0)
-                loss += self.model.evaluate(inputs, targets, verbose=0)
+                        if update == "fit":
+                            # the loss of the last epoch is only used for reporting
+                            history = self.model.fit(inputs, targets, sample_weight=weights, epochs=4, batch_size=16,
+                                                     verbose=0)
+                            loss += history.history["loss"][-1]
+                        else:
+                            # the loss a single optimizer step returns (before the step) is only used for reporting
+                            loss += float(self.model.train_on_batch(inputs, targets, sample_weight=weights))
 
                 state = next_state
 
-                self.environment.render_q(self)
-
             cumulative_reward_history.append(cumulative_reward)
 
             logging.info("episode: {:d}/{:d} | status: {:4s} | loss: {:.4f} | e: {:.5f}"
@@ -0,0 +1,62 @@
+import numpy as np
+
+
+class SumTree:
+    """ Binary tree in which every node holds the sum of the priorities below it, for prioritized sampling.
+
+        The tree is stored in a single numpy array: the root at position 1, the children of node i at 2i and 2i + 1,
+        and the priorities themselves (the leaves) at capacity ... 2 * capacity - 1, capacity being rounded up to a
+        power of 2. Changing a priority updates the sums on the path to the root, and finding the item belonging to
+        a value between 0 and the total walks down from the root; both take O(log n). Both work on a whole batch of
+        items at once, one numpy operation per level of the tree.
+    """
+
+    def __init__(self, capacity):
+        """ Create a new tree with all priorities 0.
+
+            :param int capacity: number of items
+        """
+        self.depth = max(int(np.ceil(np.log2(max(capacity, 1)))), 0)
+        self.capacity = 2 ** self.depth
+        self.tree = np.zeros(2 * self.capacity)
+
+    def total(self):
+        """ Return the sum of all priorities. """
+        return self.tree[1]
+
+    def priority(self, items):
+        """ Return the priority of the items with index 'items'. """
+        return self.tree[self.capacity + np.asarray(items)]
+
+    def update(self, items, priorities):
+        """ Set the priority of the items with index 'items'.
+
+            :param np.ndarray items: item indices
+            :param np.ndarray priorities: new priority per item
+        """
+        node = self.capacity + np.asarray(items)
+        self.tree[node] = priorities
+
+        for _ in range(self.depth):
+            node = np.unique(node // 2)
+            self.tree[node] = self.tree[2 * node] + self.tree[2 * node + 1]
+
+    def find(self, values):
+        """ Return the index of the item in which each of 'values' falls when laying out all priorities end to end.
+
+            An item is found with a probability proportional to its priority when values are drawn uniformly from
+            [0, total()).
+
+            :param np.ndarray values: values between 0 and total()
+            :return np.ndarray: item index per value
+        """
+        values = np.array(values, dtype=float)
+        node = np.ones(len(values), dtype=int)
+
+        for _ in range(self.depth):
+            left = 2 * node
+            right = values >= self.tree[left]
+            values -= np.where(right, self.tree[left], 0.0)
+            node = left + right
+
+        return node - self.capacity
@@ -0,0 +1,47 @@
+import numpy as np
+
+
+class QTable:
+    """ Table with a q value for every (cell, action) combination of a maze, for the tabular models.
+
+        The values are stored in a single (rows, cols, actions) numpy array, initially all 0. A 10^6 cell maze
+        with 4 actions takes 32 MB, instead of the gigabytes needed for a dict with a (cell, action) tuple key per
+        value. Cells are addressed by their cell index (row * ncols + col):
+
+            table[cell]             the q values of all actions of a cell, a view so reading it does not copy
+            table[cell, action]     a single q value, can be assigned to and updated in place (+=)
+
+        grid() returns all q values as a (cells, actions) view, the layout of AbstractModel.q_grid().
+    """
+    __slots__ = ("values", "__flat")
+
+    def __init__(self, game, buffer=None):
+        """ Create a new table for 'game' with all q values 0, or a table on the q values in 'buffer'.
+
+            :param class Maze game: Maze game object, its shape and number of actions determine the table size
+            :param buffer: memory holding the float64 q values, for example shared memory (optional, else new)
+        """
+        nrows, ncols = game.maze.shape
+        if buffer is None:
+            self.values = np.zeros((nrows, ncols, len(game.actions)))
+        else:
+            self.values = np.ndarray((nrows, ncols, len(game.actions)), dtype=np.float64, buffer=buffer)
+        self.__flat = self.values.reshape(nrows * ncols, len(game.actions))  # view on values by cell index
+
+    def __getitem__(self, key):
+        return self.__flat[key]
+
+    def __setitem__(self, key, value):
+        self.__flat[key] = value
+
+    def max(self, cell):
+        """ Return the highest q value of 'cell'. """
+        return max(self.__flat[cell].tolist())  # faster than numpy's max() for a handful of values
+
+    def grid(self):
+        """ Return all q values as a (cells, actions) view. """
+        return self.__flat
+
+    def load(self, grid):
+        """ Replace all q values by 'grid', a (cells, actions) array as returned by grid(). """
+        self.__flat[:] = grid
@@ -0,0 +1,109 @@
+import numpy as np
+
+
+class EligibilityTrace:
+    """ Eligibility trace for the tabular models, the (state, action) combinations visited recently and their weight.
+
+        The active entries are kept in parallel numpy arrays (cell, action, trace value), so updating the q values
+        of all of them and decaying their traces are single vectorized operations. Entries whose trace decays below
+        'threshold' are dropped, so the trace stays short however long an episode takes. They are dropped in
+        batches, whenever the trace has doubled in length since the previous time, so the bookkeeping is not
+        repeated after every step; an entry may linger for a few steps with a negligible trace.
+
+        How a visit changes the trace of a (state, action) combination depends on the kind of trace:
+
+            accumulating    trace += 1
+            replacing       trace = 1
+            dutch           trace = (1 - learning_rate) * trace + 1
+    """
+    kinds = ("accumulating", "replacing", "dutch")
+
+    def __init__(self, kind="accumulating", threshold=1e-4, learning_rate=0.10, capacity=64):
+        """ Create a new, empty, trace.
+
+            :param str kind: accumulating, replacing or dutch
+            :param float threshold: drop entries with a trace below this value (0 = never drop)
+            :param float learning_rate: (alpha) only used by dutch traces
+            :param int capacity: initial number of entries, grows when needed
+        """
+        if kind not in EligibilityTrace.kinds:
+            raise ValueError("unknown eligibility trace {}, use one of {}".format(kind, EligibilityTrace.kinds))
+
+        self.kind = kind
+        self.threshold = threshold
+        self.learning_rate = learning_rate
+
+        self.__cells = np.zeros(capacity, dtype=np.intp)
+        self.__actions = np.zeros(capacity, dtype=np.intp)
+        self.__values = np.zeros(capacity)
+        self.__size = 0  # number of active entries, at the start of the arrays
+        self.__slot = dict()  # position in the arrays per (cell, action)
+        self.__prune_at = capacity  # drop the entries below the threshold once the trace reaches this length
+
+    def __len__(self):
+        return self.__size
+
+    def clear(self):
+        """ Remove all entries, for example at the start of an episode. """
+        self.__size = 0
+        self.__slot.clear()
+
+    def visit(self, cell, action):
+        """ Increase the trace of (cell, action), add it if it is not yet in the trace. """
+        key = (int(cell), int(action))
+        slot = self.__slot.get(key)
+
+        if slot is None:
+            slot = self.__size
+            if slot == len(self.__values):
+                self.__cells = np.resize(self.__cells, 2 * slot)
+                self.__actions = np.resize(self.__actions, 2 * slot)
+                self.__values = np.resize(self.__values, 2 * slot)
+            self.__cells[slot], self.__actions[slot] = key
+            self.__values[slot] = 0.0
+            self.__slot[key] = slot
+            self.__size += 1
+
+        if self.kind == "accumulating":
+            self.__values[slot] += 1.0
+        elif self.kind == "replacing":
+            self.__values[slot] = 1.0
+        else:
+            self.__values[slot] = (1.0 - self.learning_rate) * self.__values[slot] + 1.0
+
+    def update(self, table, amount):
+        """ Add amount * trace to the q value of every (cell, action) in the trace.
+
+            :param QTable table: q values to update
+            :param float amount: learning rate * temporal difference error
+        """
+        n = self.__size
+        table.grid()[self.__cells[:n], self.__actions[:n]] += amount * self.__values[:n]
+
+    def decay(self, factor):
+        """ Multiply all traces by 'factor' and drop the entries which fell below the threshold, in batches. """
+        size = self.__size
+        values = self.__values[:size]
+        values *= factor
+
+        if self.threshold <= 0.0 or size < self.__prune_at:
+            return
+
+        drop = np.flatnonzero(values < self.threshold)
+        self.__prune_at = max(2 * (size - len(drop)), 16)
+        if len(drop) == 0:
+            return
+
+        cells, actions, slot = self.__cells, self.__actions, self.__slot
+        for key in zip(cells[drop].tolist(), actions[drop].tolist()):
+            del slot[key]
+
+        # fill the holes before the new end of the arrays with the surviving entries after it, only these move
+        n = size - len(drop)
+        holes = drop[drop < n]
+        moved = n + np.flatnonzero(values[n:] >= self.threshold)
+        cells[holes] = cells[moved]
+        actions[holes] = actions[moved]
+        values[holes] = values[moved]
+        slot.update(zip(zip(cells[holes].tolist(), actions[holes].tolist()), holes.tolist()))
+        self.__size = n
@@ -0,0 +1,115 @@
+import logging
+import random
+from datetime import datetime
+
+import numpy as np
+
+from models import AbstractModel
+
+
+class ValueIterationModel(AbstractModel):
+    """ Prediction model which plans instead of learns, using value iteration on the known rules of the maze.
+
+        The maze is deterministic and its transition table is known, so there is no need to discover it by playing.
+        Every action from every cell leads to a known next cell with a known reward: the exit reward when reaching
+        the exit, the move penalty otherwise, and the impossible move penalty for running into a wall (the agent
+        stays where it is). The penalty for revisiting a cell depends on the path taken and is left out.
+
+        Value iteration repeatedly updates the q values of all cells at once:
+
+            Q[cell, action] = reward[cell, action] + discount * max(Q[next_cell[cell, action]])
+
+        where the future value of reaching the exit is 0, as the game ends there. Every sweep is a few numpy
+        operations over the whole table, and a sweep propagates the exit reward one cell further.
+    """
+    greedy = True
+
+    def __init__(self, game, **kwargs):
+        """ Create a new prediction model for 'game'.
+
+        :param class Maze game: Maze game object
+        :param kwargs: model dependent init parameters
+        """
+        super().__init__(game, name="ValueIterationModel", **kwargs)
+        self.Q = np.zeros((game.maze.size, len(game.actions)))  # value per (cell index, action)
+
+    def q(self, state):
+        """ Get q values for all actions for a certain state. """
+        return self.Q[self.environment.index(state)]
+
+    def q_grid(self):
+        """ Return q values for all cells, indexed by cell index and action. """
+        return self.Q
+
+    def set_q_grid(self, grid):
+        """ Replace the q values by 'grid' (as returned by q_grid()), for example from a cache. """
+        self.Q = np.array(grid, dtype=self.Q.dtype)
+        self.q_version += 1
+
+    def predict(self, state):
+        """ Policy: choose the action with the highest value from the Q-table.
+            Random choice if multiple actions have the same (max) value.
+
+            :param np.ndarray state: game state
+            :return int: selected action
+        """
+        q = self.q(state)
+
+        logging.debug("q[] = {}".format(q))
+
+        actions = np.nonzero(q == np.max(q))[0]  # get index of the action(s) with the max value
+        return random.choice(actions)
+
+    def train(self, stop_at_convergence=False, **kwargs):
+        """ Compute the q values by value iteration.
+
+            :param stop_at_convergence: stop as soon as the best actions win from all start cells, else stop when
+                                        the values no longer change
+
+            Hyperparameters:
+            :keyword float discount: (gamma) preference for future rewards (0 = not at all, 1 = only)
+            :keyword float tolerance: stop when no value changes more than this in a sweep (default 0: no change)
+            :keyword int episodes: maximum number of sweeps over all cells
+            :return list, list, int, datetime: (empty) cumulative rewards, win rate per sweep (only when
+                                               stop_at_convergence), number of sweeps, total time spent
+        """
+        discount = kwargs.get("discount", 0.90)
+        tolerance = kwargs.get("tolerance", 0.0)
+        sweeps = max(kwargs.get("episodes", 1000), 1)
+
+        win_history = []
+
+        start_time = datetime.now()
+
+        # transition and reward model, impossible moves leave the agent in the same cell
+        game = self.environment
+        transitions = game.transitions
+        next_cell = np.where(transitions >= 0, transitions, np.arange(game.maze.size)[:, np.newaxis])
+        reward = np.where(next_cell == game.exit_index, game.reward_exit, game.penalty_move)
+        reward[transitions < 0] = game.penalty_impossible_move
+        future = np.where(next_cell == game.exit_index, 0.0, discount)  # reaching the exit ends the game
+
+        value = np.zeros(game.maze.size)
+
+        for sweep in range(1, sweeps + 1):
+            self.Q = reward + future * value[next_cell]
+            self.q_version += 1
+            new_value = self.Q.max(axis=1)
+            delta = np.max(np.abs(new_value - value))
+            value = new_value
+
+            if stop_at_convergence:
+                w_all, win_rate = game.check_win_all(self)
+                win_history.append((sweep, win_rate))
+                if w_all is True:
+                    logging.info("won from all start cells, stop planning")
+                    break
+
+            if delta <= tolerance:
+                break
+
+        logging.info("sweeps: {:d} | time spent: {}".format(sweep, datetime.now() - start_time))
+
+        self.environment.render_q(self)
+
+        return [], win_history, sweep, datetime.now() - start_time